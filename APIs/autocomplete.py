@@ -0,0 +1,136 @@
+import json
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+cities_json_path = BASE_DIR.parent / "my-app" / "resources" / "cities.json"
+
+UMLAUTS = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+# characters a one letter typo can be replaced with
+ALPHABET = "abcdefghijklmnopqrstuvwxyz "
+# positions before the first mismatch tried for replacements and insertions, 54 lookups each
+FUZZY_POSITIONS = 6
+NON_ALPHANUMERIC = re.compile(r"[^a-z0-9]+")
+
+
+def fold(text, umlauts=True):
+    # lower case ascii without punctuation, "Aach/ Hegau" -> "aach hegau".
+    # umlauts become ae, oe, ue or, with umlauts=False, lose their dots: "München" -> "muenchen" or "munchen"
+    text = text.lower()
+    if not text.isascii():
+        text = text.translate(UMLAUTS) if umlauts else text.replace("ß", "ss")
+        text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return NON_ALPHANUMERIC.sub(" ", text).strip()
+
+
+def deletes_and_swaps(word, end=None):
+    # strings with one character deleted or two neighbours swapped at positions up to end, the most common typos
+    for i in range(min(len(word), len(word) if end is None else end + 1)):
+        yield word[:i] + word[i + 1 :]
+        if i + 1 < len(word):
+            yield word[:i] + word[i + 1] + word[i] + word[i + 2 :]
+
+
+def replaces_and_inserts(word, i):
+    # strings with the character at position i replaced or another one inserted before it
+    left, right = word[:i], word[i:]
+    for c in ALPHABET:
+        if c != right[0]:
+            yield left + c + right[1:]
+        yield left + c + right
+
+
+class CityIndex:
+    # Sorted arrays of folded city names and zip codes. All keys starting with a prefix are
+    # next to each other, so a search is one bisect plus a scan over at most k matches.
+
+    def __init__(self, entries):
+        self.entries = entries
+        names = set()
+        zips = set()
+        for i, entry in enumerate(entries):
+            # both spellings of umlauts are indexed, people type "muenchen" as well as "munchen"
+            for key in {fold(entry["city"]), fold(entry["city"], umlauts=False)}:
+                if key:
+                    names.add((key, i))
+            for zip_code in entry["zip_codes"]:
+                zips.add((zip_code.strip(), i))
+        names = sorted(names)
+        zips = sorted(zips)
+        self.name_keys = [key for key, _ in names]
+        self.name_ids = [i for _, i in names]
+        self.zip_keys = [key for key, _ in zips]
+        self.zip_ids = [i for _, i in zips]
+
+    @classmethod
+    def load(cls, file_path):
+        with open(file_path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def _prefix_matches(keys, ids, prefix, results, k):
+        # adds the entries of up to k keys starting with prefix, an exact match sorts first
+        for j in range(bisect_left(keys, prefix), len(keys)):
+            if len(results) >= k or not keys[j].startswith(prefix):
+                return
+            results.setdefault(ids[j])
+
+    def _matched_length(self, prefix):
+        # length of the longest start of prefix that some city name starts with
+        low, high = 0, len(prefix)
+        while low < high:
+            middle = (low + high + 1) // 2
+            j = bisect_left(self.name_keys, prefix[:middle])
+            if j < len(self.name_keys) and self.name_keys[j].startswith(prefix[:middle]):
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def _fuzzy_matches(self, prefix, results, k):
+        # A wrong or missing character is at or before the first one no city name continues with,
+        # a typo further right can not make the query match. Deletions and swaps are tried up to there,
+        # replacements and insertions only at the last FUZZY_POSITIONS positions up to there, so a long
+        # query that matches nothing costs a bounded number of lookups.
+        matched = min(self._matched_length(prefix), len(prefix) - 1)
+        for candidate in deletes_and_swaps(prefix, matched):
+            self._prefix_matches(self.name_keys, self.name_ids, candidate, results, k)
+        if results:
+            return
+        for i in range(matched, max(matched - FUZZY_POSITIONS, -1), -1):
+            for candidate in replaces_and_inserts(prefix, i):
+                self._prefix_matches(self.name_keys, self.name_ids, candidate, results, k)
+            if results:
+                return
+
+    def search(self, query, k=8):
+        # top k entries whose city name or zip code starts with the query,
+        # names with one typo in the typed part are only tried if nothing matches
+        prefix = fold(query)
+        if not prefix:
+            return []
+        results = {}
+        if prefix.isdigit():
+            self._prefix_matches(self.zip_keys, self.zip_ids, prefix, results, k)
+        else:
+            self._prefix_matches(self.name_keys, self.name_ids, prefix, results, k)
+            if not results and len(prefix) >= 3:
+                self._fuzzy_matches(prefix, results, k)
+        return [self.entries[i] for i in results]
+
+
+_city_index = None
+_city_index_lock = threading.Lock()
+
+
+def get_city_index():
+    # built on the first search, workers start without parsing cities.json
+    global _city_index
+    if _city_index is None:
+        with _city_index_lock:
+            if _city_index is None:
+                _city_index = CityIndex.load(cities_json_path)
+    return _city_index
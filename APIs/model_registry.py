@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+from pathlib import Path
+import dotenv
+from model.mlp import MLP, InferenceEngine, MULTI_OUTPUT_MODEL
+from model.data_processing import FEATURE_SET_VERSION
+from APIs.prediction_table import PredictionTable
+from APIs.monitoring import Histogram
+
+dotenv.load_dotenv()  # load environment variables from .env file
+
+BASE_DIR = Path(__file__).resolve().parent
+weights_dir = BASE_DIR.parent / "model" / "weights"
+
+model_load_seconds = Histogram(
+    "model_load_seconds", "Time to load weights and build the prediction table", ["model"]
+)
+
+# fuel types we serve predictions for, also the output order of a multi-output model
+FUEL_TYPES = ("diesel", "e5", "e10")
+
+
+class ModelRegistry:
+    # keeps every loaded model in memory and swaps in new weights
+    # when the files on disk change, so retraining never needs a restart.
+    # Models are named after their artifact {name}.npz (or an old weights folder {name}/):
+    # one per fuel type, or a single multi-output model that serves all fuel types from one forward pass.
+    # The multi-output model is used as soon as it exists, until then every fuel type has its own model.
+
+    def __init__(
+        self,
+        weights_dir,
+        fuel_types=FUEL_TYPES,
+        multi_output_model=None,
+        check_interval=5.0,
+        table_step_minutes=None,
+    ):
+        self.weights_dir = Path(weights_dir)
+        self.fuel_types = tuple(fuel_types)
+        self.multi_output_model = multi_output_model
+        # model name -> fuel types it serves, in the order of its outputs
+        self.model_outputs = {f: [f] for f in self.fuel_types}
+        if multi_output_model:
+            self.model_outputs[multi_output_model] = list(self.fuel_types)
+        # seconds between two mtime checks of the same model
+        self.check_interval = check_interval
+        # monotonic time of the last check whether the multi-output model exists, and its result
+        self._multi_checked = None
+        self._multi_exists = False
+        # grid of the precomputed weekly prediction table, None serves every request live
+        self.table_step_minutes = table_step_minutes
+        # name -> (version, engine, table), replaced as a whole on reload
+        self._models = {}
+        self._last_check = {}
+        self._lock = threading.Lock()
+
+    def _artifact(self, name):
+        return self.weights_dir / f"{name}.npz"
+
+    def _exists(self, name):
+        return self._artifact(name).exists() or (self.weights_dir / name).is_dir()
+
+    def _use_multi_output_model(self):
+        # checked every check_interval seconds, so a first training run is picked up without a restart
+        if not self.multi_output_model:
+            return False
+        now = time.monotonic()
+        if self._multi_checked is None or now - self._multi_checked >= self.check_interval:
+            self._multi_exists = self._exists(self.multi_output_model)
+            self._multi_checked = now
+        return self._multi_exists
+
+    def _version(self, name):
+        # the mtime of the artifact, it is replaced atomically by every save
+        if self._artifact(name).exists():
+            return os.stat(self._artifact(name)).st_mtime_ns
+        # the newest mtime of all weight files is the version of an old weights folder
+        files = list((self.weights_dir / name).glob("layer_*.npy"))
+        if not files:
+            raise FileNotFoundError(f"no model {name} in {self.weights_dir}")
+        return max(os.stat(f).st_mtime_ns for f in files)
+
+    def _build(self, name):
+        # returns (mlp, header), the architecture comes from the artifact header or the shapes
+        # of the weight files. Old weights folders have no header
+        if not self._artifact(name).exists():
+            return MLP.load_weights_folder(str(self.weights_dir / name)), {}
+        mlp, header = MLP.load(self._artifact(name))
+        feature_set_version = header.get("feature_set_version")
+        if feature_set_version is not None and feature_set_version != FEATURE_SET_VERSION:
+            raise ValueError(
+                f"{name} model was trained on feature set {feature_set_version}, serving {FEATURE_SET_VERSION}"
+            )
+        # the outputs have to be in the order the registry reads them
+        outputs = header.get("outputs")
+        served = self.model_outputs[name]
+        if outputs is not None and outputs[: len(served)] != served:
+            raise ValueError(f"{name} model predicts {outputs}, expected {served}")
+        return mlp, header
+
+    def _load(self, name, version):
+        start = time.perf_counter()
+        mlp, header = self._build(name)
+        if mlp.layers[-1].weights.shape[1] < len(self.model_outputs[name]):
+            raise ValueError(f"{name} model has fewer outputs than the fuel types it serves")
+        table = None
+        if self.table_step_minutes and PredictionTable.supports(header.get("feature_names")):
+            table = PredictionTable.build(mlp, self.table_step_minutes)
+        # requests are served by a stateless engine that can be shared between threads
+        engine = InferenceEngine(mlp)
+        self._models[name] = (version, engine, table)
+        model_load_seconds.observe(time.perf_counter() - start, (name,))
+        print(f"Loaded {name} model (version {version})")
+        return engine
+
+    def load_all(self):
+        # the models that serve requests right now
+        names = [self.multi_output_model] if self._use_multi_output_model() else self.fuel_types
+        for name in names:
+            self.reload(name)
+
+    def reload(self, name):
+        with self._lock:
+            self._last_check[name] = time.monotonic()
+            return self._load(name, self._version(name))
+
+    def resolve(self, fuel_type):
+        # model name and output column that predict the fuel type
+        if fuel_type not in self.fuel_types:
+            raise KeyError(fuel_type)
+        if self._use_multi_output_model():
+            return self.multi_output_model, self.fuel_types.index(fuel_type)
+        return fuel_type, 0
+
+    def get(self, name):
+        if name not in self.model_outputs:
+            raise KeyError(name)
+
+        entry = self._models.get(name)
+        now = time.monotonic()
+        if entry is not None and now - self._last_check.get(name, 0) < self.check_interval:
+            return entry[1]
+
+        with self._lock:
+            # another thread may have reloaded while we were waiting for the lock
+            entry = self._models.get(name)
+            self._last_check[name] = now
+            try:
+                version = self._version(name)
+            except (OSError, ValueError):
+                # weights are being rewritten, keep serving the old model
+                if entry is None:
+                    raise
+                return entry[1]
+            if entry is None or entry[0] != version:
+                try:
+                    return self._load(name, version)
+                except (OSError, ValueError) as e:
+                    if entry is None:
+                        raise
+                    print(f"Error reloading {name} model, keeping old weights: {e}")
+            return entry[1]
+
+    def get_table(self, name):
+        # returns None if the model has to be evaluated live
+        self.get(name)
+        return self._models[name][2]
+
+
+# "table" answers from precomputed weekly predictions, "live" runs the MLP per request
+prediction_mode = os.getenv("prediction_mode", "table")
+table_step_minutes = int(os.getenv("prediction_table_step", "15"))
+# model with one output per fuel type, served once model/weights/<name>.npz exists. Empty always serves one model per fuel type
+multi_output_model = os.getenv("multi_output_model", MULTI_OUTPUT_MODEL)
+
+registry = ModelRegistry(
+    weights_dir,
+    multi_output_model=multi_output_model or None,
+    table_step_minutes=table_step_minutes if prediction_mode == "table" else None,
+)
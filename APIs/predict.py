@@ -1,19 +1,33 @@
-from datetime import date
+from contextlib import asynccontextmanager
+import time
+from datetime import datetime
 import os
 import zoneinfo
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-import pandas as pd
 import requests
 from APIs.tk_client import get_info_from_station
-from model.mlp import MLP
+from APIs.autocomplete import get_city_index
+from APIs.model_registry import registry
+from APIs.monitoring import REGISTRY, Counter, Gauge, Histogram
+from APIs.profiling import ProfileMiddleware, profiled
 from model.data_processing import FeatureEngineer
 import numpy as np
 import dotenv
 
 dotenv.load_dotenv()  # load environment variables from .env file
 
-app = FastAPI()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # load all models once, requests are served from memory afterwards
+    registry.load_all()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 tk_api_key = os.getenv("api_key")
 
@@ -28,6 +42,53 @@ app.add_middleware(
     allow_credentials=True,
 )
 
+http_requests = Counter("http_requests_total", "Requests by route and status code", ["route", "status"])
+http_latency = Histogram("http_request_seconds", "Request latency by route", ["route"])
+http_in_flight = Gauge("http_requests_in_flight", "Requests currently being handled")
+model_inference_seconds = Histogram(
+    "model_inference_seconds", "Time to predict a horizon per model", ["model", "mode"]
+)
+
+
+class RequestMetricsMiddleware:
+    # counts requests by route and status and times them. A plain ASGI middleware,
+    # @app.middleware("http") would add a task group and memory streams to every request
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        http_in_flight.inc()
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_in_flight.dec()
+            # the route template keeps the number of label values small, e.g. /stations/{city}
+            route = scope.get("route")
+            route = route.path if route is not None else "unmatched"
+            http_requests.inc((route, str(status)))
+            http_latency.observe(time.perf_counter() - start, (route,))
+
+
+app.add_middleware(RequestMetricsMiddleware)
+app.add_middleware(ProfileMiddleware)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 
 
 @app.get("/")
@@ -35,28 +96,74 @@ def read_root():
     return {"Hello": "World"}
 
 @app.get("/stations/{city}")
+@profiled
 def get_info(city: str):
     return get_info_from_station(city)
 
+# city names and zip codes starting with q, in the format of cities.json
+@app.get("/autocomplete")
+@profiled
+def autocomplete(q: str = Query(..., max_length=100), k: int = Query(8, ge=1, le=50)):
+    return get_city_index().search(q, k)
+
+
+def resolve_model(fuel_type):
+    # model name and output column for the fuel type
+    try:
+        return registry.resolve(fuel_type)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown fuel type: {fuel_type}")
+
+
+def predict_horizon(fuel_types, horizon_hours, step_minutes):
+    # group the fuel types by model, a multi-output model answers all of them in one pass
+    outputs = {}
+    for fuel_type in fuel_types:
+        name, column = resolve_model(fuel_type)
+        outputs.setdefault(name, []).append((fuel_type, column))
+
+    current_time = datetime.now(zoneinfo.ZoneInfo("Europe/Berlin"))
+    current_time = current_time.replace(tzinfo=None)  # remove timezone information for feature engineering
+    steps = max(1, (horizon_hours * 60) // step_minutes)
+    timestamps = np.datetime64(current_time, "s") + np.arange(steps) * np.timedelta64(step_minutes, "m")
+
+    predictions = {}
+    X = None
+    for name, columns in outputs.items():
+        # get the model from the registry, weights are reloaded if they changed on disk
+        model = registry.get(name)
+        table = registry.get_table(name)
+        start = time.perf_counter()
+        if table is not None:
+            values = table.lookup(timestamps)
+            model_inference_seconds.observe(time.perf_counter() - start, (name, "table"))
+        else:
+            if X is None:
+                # build the features for the whole horizon at once, shape [steps, 7]
+                X = FeatureEngineer.create_time_features(timestamps)
+            # one forward pass per model over all time steps
+            values = model.predict(X)
+            model_inference_seconds.observe(time.perf_counter() - start, (name, "live"))
+        for fuel_type, column in columns:
+            predictions[fuel_type] = values[:, column].tolist()
+    return predictions
+
+
+# request for fuel price predictions of several fuel types over an arbitrary horizon
+@app.get("/predict")
+@profiled
+def predict_batch(
+    fuel_types: str = "e5,e10,diesel",
+    horizon_hours: int = Query(24, ge=1, le=168),
+    step_minutes: int = Query(240, ge=5, le=1440),
+):
+    fuel_types = [f.strip() for f in fuel_types.split(",") if f.strip()]
+    return predict_horizon(fuel_types, horizon_hours, step_minutes)
+
+
 # request for fuel price prediction
 @app.get("/predict/{fuel_type}")
+@profiled
 def predict(fuel_type: str):
-    # initialize the model
-    mlp = MLP(7, 16, 2, 1)
-    # load the model weights
-    mlp.load_weights(f"model/weights/{fuel_type}")
-
-    predictions = []
-
-    # make prediction for the next 24 hours
-    current_time = pd.Timestamp.now(tz=zoneinfo.ZoneInfo("Europe/Berlin"))
-    current_time = pd.to_datetime(current_time).tz_localize(None)  # remove timezone information for feature engineering  
-    for i in range(6):
-        X = FeatureEngineer.create_time_features(current_time + pd.Timedelta(hours=i*4))
-        prediction = mlp.predict(X.reshape(1, -1))[0][0]
-        print("time:", current_time + pd.Timedelta(hours=i*4), "Predicted price:", prediction)
-        predictions.append(prediction)
-    
-    return predictions
-        
-    
\ No newline at end of file
+    # make prediction for the next 24 hours in steps of 4 hours
+    return predict_horizon([fuel_type], 24, 240)[fuel_type]
@@ -0,0 +1,85 @@
+import numpy as np
+from model.data_processing import FeatureEngineer, HOLIDAY_CALENDAR, TIME_FEATURE_NAMES
+
+# a monday without holidays, used as reference week to build the table
+REFERENCE_MONDAY = np.datetime64("2026-01-05T00:00", "m")
+
+
+class PredictionTable:
+    # The calendar-only model depends on time of day, weekday and the two holiday flags,
+    # so its predictions over a week fit into a small table.
+    # values.shape = [4, 7, slots_per_day + 1, n_outputs], the first axis is 2 * is_holiday + is_day_before_holiday.
+    # The model jumps at midnight when the weekday and holiday flags change, so every day has an extra
+    # slot for 24:00 with its own flags and lookups only interpolate within a day.
+
+    def __init__(self, values, step_minutes):
+        self.values = values
+        self.step_minutes = step_minutes
+
+    @staticmethod
+    def supports(feature_names):
+        # only models that use nothing but the calendar features can be tabulated,
+        # models without feature names in their artifact are served live
+        return feature_names is not None and list(feature_names) == TIME_FEATURE_NAMES
+
+    @classmethod
+    def build(cls, mlp, step_minutes=15):
+        if (24 * 60) % step_minutes != 0:
+            raise ValueError("step_minutes has to divide a day")
+        slots_per_day = 24 * 60 // step_minutes
+        timestamps = REFERENCE_MONDAY + np.arange(7 * slots_per_day) * np.timedelta64(step_minutes, "m")
+        # shape [7, slots_per_day, 7]
+        X = FeatureEngineer.create_time_features(timestamps).astype(np.float64)
+        X = X.reshape(7, slots_per_day, -1)
+        # 24:00 has the time features of 00:00 (they are periodic) and the flags of the same day
+        X = np.concatenate([X, X[:, :1]], axis=1).reshape(7 * (slots_per_day + 1), -1)
+
+        values = np.empty((4, 7 * (slots_per_day + 1), mlp.layers[-1].weights.shape[1]))
+        for variant in range(4):
+            X[:, 5] = variant >> 1
+            X[:, 6] = variant & 1
+            values[variant] = mlp.predict(X)
+        return cls(values.reshape(4, 7, slots_per_day + 1, -1), step_minutes)
+
+    def lookup(self, timestamps):
+        # returns shape [len(timestamps), n_outputs]
+        timestamps = np.asarray(timestamps, dtype="datetime64[s]")
+        days = timestamps.astype("datetime64[D]")
+
+        # 1970-01-01 was a thursday, shift by 3 so that monday is 0
+        weekday = (days.astype(np.int64) + 3) % 7
+        seconds = (timestamps - days).astype(np.int64)
+        position = seconds / (self.step_minutes * 60)
+
+        lower = np.floor(position)
+        fraction = (position - lower)[:, None]
+        # the last slot of a day interpolates towards 24:00 of the same day
+        i0 = lower.astype(np.int64)
+        i1 = i0 + 1
+
+        day_ordinals = days.astype(np.int64)
+        variant = 2 * HOLIDAY_CALENDAR.is_holiday(day_ordinals) + HOLIDAY_CALENDAR.is_holiday(day_ordinals + 1)
+        return (1 - fraction) * self.values[variant, weekday, i0] + fraction * self.values[variant, weekday, i1]
+
+
+if __name__ == "__main__":
+    # compares the table of the shipped weights with live predictions: python -m APIs.prediction_table
+    from model.mlp import MLP
+    from pathlib import Path
+
+    weights_dir = Path(__file__).resolve().parent.parent / "model" / "weights"
+    # every minute of a week and the minutes around midnight before and after holidays
+    timestamps = np.concatenate(
+        [np.datetime64("2026-07-06T00:00") + np.arange(7 * 24 * 60) * np.timedelta64(1, "m")]
+        + [
+            np.datetime64(day) + np.arange(-30, 30) * np.timedelta64(1, "m")
+            for day in ["2026-04-03T00:00", "2026-04-04T00:00", "2026-12-25T00:00", "2027-01-01T00:00"]
+        ]
+    )
+    minutes = (timestamps - timestamps.astype("datetime64[D]")).astype("timedelta64[m]").astype(np.int64)
+    for folder in sorted(p for p in weights_dir.iterdir() if p.is_dir()):
+        mlp = MLP.load_weights_folder(str(folder))
+        table = PredictionTable.build(mlp)
+        error = np.abs(table.lookup(timestamps) - mlp.predict(FeatureEngineer.create_time_features(timestamps)))
+        error = error.max(axis=1)
+        print(f"{folder.name}: max error {error.max():.4f}, before midnight {error[minutes >= 23 * 60].max():.4f}")
@@ -0,0 +1,447 @@
+import fcntl
+import os
+import shutil
+import threading
+import time
+import numpy as np
+import dotenv
+from APIs.monitoring import Counter
+
+dotenv.load_dotenv()  # load environment variables from .env file
+
+# directory of the price history, leave empty to not record prices
+price_history_dir = os.getenv("price_history_dir", "")
+# segments older than this are deleted
+price_history_retention_days = float(os.getenv("price_history_retention_days", "30"))
+# time span of one segment file, closed segments are compacted
+price_history_segment_hours = float(os.getenv("price_history_segment_hours", "24"))
+# price changes kept per station and segment, further changes of the segment are dropped
+price_history_capacity = int(os.getenv("price_history_capacity", "96"))
+# upper bound for the number of stations, every segment reserves a row per station
+price_history_max_stations = int(os.getenv("price_history_max_stations", "32768"))
+
+FUELS = ("diesel", "e5", "e10")
+
+price_history_dropped = Counter(
+    "price_history_dropped_total", "Price changes not recorded because the row of the station was full"
+)
+
+# Append-only price history of every station, one segment directory per time span:
+#   slots.txt                   station ids, the line number is the slot of the station
+#   seg-{start}/                open segment, fixed rows that are appended to
+#       counts.npy              int32 [max_stations], records per slot
+#       times.npy               int64 [max_stations, capacity], unix seconds
+#       {fuel}.npy              float32 [max_stations, capacity], nan if the station has no price
+#       overflow.npy            int64 [max_stations], time of the first dropped change of a full row, 0 if none
+#   seg-{start}-compact/        closed segment, rows packed one after another
+#       offsets.npy             int64 [slots + 1], row of slot i is offsets[i]:offsets[i + 1]
+#       times.npy, {fuel}.npy   [records]
+#       overflow.npy            int64 [slots]
+#       {fuel}_min.npy          float32 [levels, records], sparse table: level k - 1 holds the minimum
+#                               of the 2**k records starting at each record, for range minimums in O(1)
+# The rows of a station are sorted by time, so every lookup is a binary search.
+# Prices after the overflow time of a row are unknown, lookups there return None instead of a stale price.
+# All files are memory mapped, several worker processes share one store through a file lock.
+
+
+class OpenSegment:
+    def __init__(self, path, start):
+        self.path = path
+        self.start = start
+        self.counts = np.load(os.path.join(path, "counts.npy"), mmap_mode="r+")
+        self.times = np.load(os.path.join(path, "times.npy"), mmap_mode="r+")
+        self.prices = {fuel: np.load(os.path.join(path, f"{fuel}.npy"), mmap_mode="r+") for fuel in FUELS}
+        self.overflow = np.load(os.path.join(path, "overflow.npy"), mmap_mode="r+")
+
+    @classmethod
+    def create(cls, path, start, max_stations, capacity):
+        # the files are sparse, only rows of stations with prices take up disk space
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        os.makedirs(tmp_path)
+        np.lib.format.open_memmap(os.path.join(tmp_path, "counts.npy"), "w+", np.int32, (max_stations,)).flush()
+        np.lib.format.open_memmap(os.path.join(tmp_path, "overflow.npy"), "w+", np.int64, (max_stations,)).flush()
+        np.lib.format.open_memmap(
+            os.path.join(tmp_path, "times.npy"), "w+", np.int64, (max_stations, capacity)
+        ).flush()
+        for fuel in FUELS:
+            np.lib.format.open_memmap(
+                os.path.join(tmp_path, f"{fuel}.npy"), "w+", np.float32, (max_stations, capacity)
+            ).flush()
+        os.rename(tmp_path, path)
+        return cls(path, start)
+
+    def row(self, slot):
+        if slot >= len(self.counts):
+            return self.times[:0, 0], {fuel: self.prices[fuel][:0, 0] for fuel in FUELS}
+        count = self.counts[slot]
+        return self.times[slot, :count], {fuel: self.prices[fuel][slot, :count] for fuel in FUELS}
+
+    def overflow_time(self, slot):
+        return int(self.overflow[slot]) if slot < len(self.overflow) else 0
+
+    def range_min(self, slot, fuel, i, j):
+        # minimum of the records i:j of the row, a row has at most capacity records
+        return np.fmin.reduce(self.prices[fuel][slot, i:j], initial=np.nan)
+
+    def append(self, slot, timestamp, prices):
+        # returns False if the change was dropped because the row is full
+        if slot >= len(self.counts):
+            return True
+        count = int(self.counts[slot])
+        if count > 0:
+            if self.times[slot, count - 1] > timestamp:
+                return True
+            last = np.array([self.prices[fuel][slot, count - 1] for fuel in FUELS])
+            # only price changes are stored
+            if np.array_equal(last, prices, equal_nan=True):
+                return True
+        if self.overflow[slot]:
+            return False
+        if count == self.times.shape[1]:
+            # the stored records stay correct, lookups from now on in this segment return None
+            self.overflow[slot] = timestamp
+            return False
+        self.times[slot, count] = timestamp
+        for fuel, price in zip(FUELS, prices):
+            self.prices[fuel][slot, count] = price
+        # the count is written last, readers never see a half written record
+        self.counts[slot] = count + 1
+        return True
+
+    def compact(self, path):
+        slots = int(np.flatnonzero(self.counts)[-1]) + 1 if self.counts.any() else 0
+        counts = np.asarray(self.counts[:slots], dtype=np.int64)
+        offsets = np.zeros(slots + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        # mask of the used part of every row
+        used = np.arange(self.times.shape[1]) < counts[:, None]
+
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, "offsets.npy"), offsets)
+        np.save(os.path.join(tmp_path, "times.npy"), self.times[:slots][used])
+        np.save(os.path.join(tmp_path, "overflow.npy"), np.asarray(self.overflow[:slots]))
+        # every range inside a row is covered by two blocks of 2**level records
+        levels = max(int(counts.max()).bit_length() - 1, 0) if slots else 0
+        for fuel in FUELS:
+            prices = self.prices[fuel][:slots][used]
+            np.save(os.path.join(tmp_path, f"{fuel}.npy"), prices)
+            np.save(os.path.join(tmp_path, f"{fuel}_min.npy"), _sparse_table(prices, levels))
+        os.rename(tmp_path, path)
+        return CompactSegment(path, self.start)
+
+
+def _sparse_table(values, levels):
+    # level k - 1 holds min(values[i : i + 2**k]), blocks running past the end are cut off.
+    # blocks may span several rows, lookups only use blocks that lie inside one row
+    table = np.empty((levels, len(values)), dtype=values.dtype)
+    previous = values
+    for k in range(1, levels + 1):
+        half = 1 << (k - 1)
+        current = previous.copy()
+        current[:-half] = np.fmin(previous[:-half], previous[half:])
+        table[k - 1] = current
+        previous = current
+    return table
+
+
+class CompactSegment:
+    def __init__(self, path, start):
+        self.path = path
+        self.start = start
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.times = np.load(os.path.join(path, "times.npy"), mmap_mode="r")
+        self.prices = {fuel: np.load(os.path.join(path, f"{fuel}.npy"), mmap_mode="r") for fuel in FUELS}
+        self.overflow = np.load(os.path.join(path, "overflow.npy"), mmap_mode="r")
+        self.minimums = {fuel: np.load(os.path.join(path, f"{fuel}_min.npy"), mmap_mode="r") for fuel in FUELS}
+
+    def overflow_time(self, slot):
+        return int(self.overflow[slot]) if slot < len(self.overflow) else 0
+
+    def range_min(self, slot, fuel, i, j):
+        # minimum of the records i:j of the row from two overlapping blocks of the sparse table
+        begin = int(self.offsets[slot])
+        level = (j - i).bit_length() - 1
+        if level == 0:
+            return self.prices[fuel][begin + i]
+        table = self.minimums[fuel][level - 1]
+        return np.fmin(table[begin + i], table[begin + j - (1 << level)])
+
+    def row(self, slot):
+        if slot + 1 >= len(self.offsets):
+            return self.times[:0], {fuel: self.prices[fuel][:0] for fuel in FUELS}
+        begin, end = self.offsets[slot], self.offsets[slot + 1]
+        return self.times[begin:end], {fuel: self.prices[fuel][begin:end] for fuel in FUELS}
+
+
+class PriceHistory:
+    def __init__(
+        self,
+        directory,
+        retention_days=30,
+        segment_hours=24,
+        capacity=96,
+        max_stations=32768,
+    ):
+        self.directory = directory
+        self.retention = retention_days * 86400
+        self.segment_seconds = int(segment_hours * 3600)
+        self.capacity = capacity
+        self.max_stations = max_stations
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.lock_path = os.path.join(directory, "lock")
+        self.slots_path = os.path.join(directory, "slots.txt")
+
+        # station id -> slot as sorted arrays, read from slots.txt
+        self.slot_ids = np.array([], dtype="S1")
+        self.slot_numbers = np.array([], dtype=np.int64)
+        self.slots_read = 0
+        self.slot_count = 0
+        # segments sorted by start time
+        self.segments = []
+        self.segments_version = None
+
+    def _file_lock(self):
+        # serializes writers of all processes that share the directory
+        f = open(self.lock_path, "a")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def _refresh_slots(self):
+        # reads the ids other processes appended to slots.txt since the last refresh
+        if not os.path.exists(self.slots_path) or os.path.getsize(self.slots_path) == self.slots_read:
+            return
+        with open(self.slots_path, "rb") as f:
+            f.seek(self.slots_read)
+            data = f.read()
+        # a line that is still being written is read next time
+        data = data[: data.rfind(b"\n") + 1]
+        self.slots_read += len(data)
+        new_ids = data.split()
+        if not new_ids:
+            return
+        ids = np.concatenate([self.slot_ids, np.array(new_ids, dtype="S")])
+        numbers = np.concatenate([self.slot_numbers, np.arange(self.slot_count, self.slot_count + len(new_ids))])
+        self.slot_count += len(new_ids)
+        order = np.argsort(ids, kind="stable")
+        self.slot_ids = ids[order]
+        self.slot_numbers = numbers[order]
+
+    def _find_slot(self, station_id):
+        key = station_id.encode("utf-8")
+        i = int(np.searchsorted(self.slot_ids, key))
+        if i < len(self.slot_ids) and self.slot_ids[i] == key:
+            return int(self.slot_numbers[i])
+        return None
+
+    def slot(self, station_id):
+        slot = self._find_slot(station_id)
+        if slot is None:
+            with self.lock:
+                self._refresh_slots()
+                slot = self._find_slot(station_id)
+        return slot
+
+    def _add_slots(self, station_ids):
+        # called with both locks held
+        self._refresh_slots()
+        new_ids = [s for s in dict.fromkeys(station_ids) if self._find_slot(s) is None]
+        new_ids = new_ids[: max(0, self.max_stations - self.slot_count)]
+        if new_ids:
+            with open(self.slots_path, "ab") as f:
+                f.write(b"".join(s.encode("utf-8") + b"\n" for s in new_ids))
+            self._refresh_slots()
+
+    def _refresh_segments(self):
+        # the directory changes whenever a segment is created, compacted or deleted
+        version = os.stat(self.directory).st_mtime_ns
+        if version == self.segments_version:
+            return
+        names = set(os.listdir(self.directory))
+        # segments that did not change stay mapped
+        known = {segment.path: segment for segment in self.segments}
+        segments = []
+        for name in names:
+            if not name.startswith("seg-") or ".tmp" in name:
+                continue
+            path = os.path.join(self.directory, name)
+            start = int(name.split("-")[1])
+            try:
+                if path in known:
+                    segments.append(known[path])
+                elif name.endswith("-compact"):
+                    segments.append(CompactSegment(path, start))
+                elif f"{name}-compact" not in names:
+                    segments.append(OpenSegment(path, start))
+            except FileNotFoundError:
+                # compacted or deleted while listing, the next refresh lists the directory again
+                version = None
+        self.segments = sorted(segments, key=lambda segment: segment.start)
+        self.segments_version = version
+
+    def _segment_path(self, start):
+        return os.path.join(self.directory, f"seg-{start:012d}")
+
+    def _open_segment(self, timestamp):
+        # called with both locks held, creates the segment of the timestamp if needed
+        start = int(timestamp) // self.segment_seconds * self.segment_seconds
+        self._refresh_segments()
+        if self.segments and self.segments[-1].start > start:
+            # older than the current segment, the history is append-only
+            return None
+        if self.segments and self.segments[-1].start == start:
+            return self.segments[-1] if isinstance(self.segments[-1], OpenSegment) else None
+        segment = OpenSegment.create(self._segment_path(start), start, self.max_stations, self.capacity)
+        self._refresh_segments()
+        # a new segment closes the previous ones, they are cleaned up in the background
+        # so the request that opened it does not wait for the compaction
+        threading.Thread(target=self._maintain_in_background, args=(timestamp,), daemon=True).start()
+        return segment
+
+    def _maintenance_lock(self):
+        # one process at a time cleans up, the others skip it. Writers are not blocked,
+        # closed and expired segments are never written to again.
+        f = open(os.path.join(self.directory, "maintenance.lock"), "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return None
+        return f
+
+    def _maintain(self, now):
+        # deletes expired segments and compacts closed ones, returns False if another thread
+        # or process is already doing it
+        lock = self._maintenance_lock()
+        if lock is None:
+            return False
+        with lock:
+            with self.lock:
+                self._refresh_segments()
+                segments = list(self.segments)
+            current = int(now) // self.segment_seconds * self.segment_seconds
+            for segment in segments:
+                if segment.start + self.segment_seconds <= now - self.retention:
+                    shutil.rmtree(segment.path, ignore_errors=True)
+                elif isinstance(segment, OpenSegment) and segment.start < current:
+                    if not os.path.exists(f"{segment.path}-compact"):
+                        segment.compact(f"{segment.path}-compact")
+                    shutil.rmtree(segment.path, ignore_errors=True)
+        return True
+
+    def _maintain_in_background(self, now):
+        try:
+            self._maintain(now)
+        except OSError as e:
+            print(f"Error compacting price history: {e}")
+
+    def record(self, prices, timestamp=None):
+        # prices as returned by the TK API: station_id -> {"status", "e5", "e10", "diesel"}
+        timestamp = int(time.time() if timestamp is None else timestamp)
+        rows = {}
+        for station_id, info in prices.items():
+            if not info or info.get("status") != "open":
+                continue
+            # stations that do not sell a fuel report false instead of a price
+            rows[station_id] = [
+                float(info[fuel])
+                if isinstance(info.get(fuel), (int, float)) and not isinstance(info[fuel], bool)
+                else np.nan
+                for fuel in FUELS
+            ]
+        if not rows:
+            return
+        with self.lock, self._file_lock():
+            self._add_slots(list(rows))
+            segment = self._open_segment(timestamp)
+            if segment is None:
+                return
+            for station_id, values in rows.items():
+                slot = self._find_slot(station_id)
+                if slot is not None and not segment.append(slot, timestamp, np.array(values, dtype=np.float32)):
+                    price_history_dropped.inc()
+
+    def compact(self, now=None):
+        return self._maintain(time.time() if now is None else now)
+
+    def _segments(self):
+        with self.lock:
+            self._refresh_segments()
+            return self.segments
+
+    def _last_record(self, slot, fuel, timestamp):
+        # (price, known): the last price at or before the timestamp, nan if there is none.
+        # known is False if the price changed after the row of a segment was full
+        for segment in reversed(self._segments()):
+            if segment.start > timestamp:
+                continue
+            overflow = segment.overflow_time(slot)
+            if overflow and timestamp >= overflow:
+                return np.nan, False
+            times, prices = segment.row(slot)
+            i = int(np.searchsorted(times, timestamp, side="right")) - 1
+            if i >= 0:
+                return float(prices[fuel][i]), True
+        return np.nan, True
+
+    def last_price(self, station_id, fuel, timestamp):
+        # last price of the station at or before the timestamp, None if there is none or it is unknown
+        slot = self.slot(station_id)
+        if slot is None:
+            return None
+        price, _ = self._last_record(slot, fuel, timestamp)
+        # prices are stored as float32, the TK API reports three decimals
+        return None if np.isnan(price) else round(price, 3)
+
+    def min_price(self, station_id, fuel, start, end):
+        # lowest price of the station between start and end, including the price valid at start.
+        # None if there is no price or changes in the window were dropped
+        slot = self.slot(station_id)
+        if slot is None:
+            return None
+        result, known = self._last_record(slot, fuel, start)
+        if not known:
+            return None
+        # binary searches for the window and O(1) range minimums of the compacted segments,
+        # open segments scan at most capacity records
+        for segment in self._segments():
+            if segment.start > end or segment.start + self.segment_seconds <= start:
+                continue
+            overflow = segment.overflow_time(slot)
+            if overflow and overflow <= end:
+                # changes inside the window were dropped, the minimum is unknown
+                return None
+            times, _ = segment.row(slot)
+            i = int(np.searchsorted(times, start, side="right"))
+            j = int(np.searchsorted(times, end, side="right"))
+            if i < j:
+                result = np.fmin(result, segment.range_min(slot, fuel, i, j))
+        return None if np.isnan(result) else round(float(result), 3)
+
+    def history_features(self, station_id, fuel, timestamp, window_hours=24, lag_hours=(1, 24)):
+        # serving time counterpart of FeatureEngineer.create_price_history_features:
+        # [price_min_{window_hours}h], [price_lag_{k}h] for k in lag_hours
+        features = [self.min_price(station_id, fuel, timestamp - window_hours * 3600, timestamp)]
+        features += [self.last_price(station_id, fuel, timestamp - k * 3600) for k in lag_hours]
+        return features
+
+
+def open_price_history():
+    # None if recording is disabled or the directory can not be used, the API works without it
+    if not price_history_dir:
+        return None
+    try:
+        return PriceHistory(
+            price_history_dir,
+            retention_days=price_history_retention_days,
+            segment_hours=price_history_segment_hours,
+            capacity=price_history_capacity,
+            max_stations=price_history_max_stations,
+        )
+    except OSError as e:
+        print(f"Could not open price history {price_history_dir}: {e}")
+        return None
+
+
+price_history = open_price_history()
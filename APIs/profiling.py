@@ -0,0 +1,130 @@
+import contextvars
+import cProfile
+import functools
+import itertools
+import os
+import pstats
+import re
+import threading
+import time
+from starlette.requests import Request
+import dotenv
+
+dotenv.load_dotenv()  # load environment variables from .env file
+
+# directory the profiles are written to, one .pstats file per profiled request
+profile_dir = os.getenv("profile_dir", "profiles")
+# client addresses that may ask for a profile with "X-Profile: 1" or "?profile=1", empty disables it
+profile_allowlist = {host.strip() for host in os.getenv("profile_allowlist", "").split(",") if host.strip()}
+# profile every n-th request without being asked, 0 disables it
+profile_sample_rate = int(os.getenv("profile_sample_rate", "0"))
+
+# counts the requests of profiled routes only, for profile_sample_rate
+_request_counter = itertools.count(1)
+# the profile of the current request, copied into the threads that run the handlers
+_current_profile = contextvars.ContextVar("current_profile", default=None)
+
+
+class RequestProfile:
+    def __init__(self, reason):
+        # None until the profiled handler decides whether its request is sampled
+        self.reason = reason
+        self.profilers = []
+        self.lock = threading.Lock()
+
+    def add(self, profiler):
+        with self.lock:
+            self.profilers.append(profiler)
+
+    def save(self, route):
+        # nothing was profiled if the route has no profiled handler
+        if not self.profilers:
+            return None
+        os.makedirs(profile_dir, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        path = os.path.join(profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}_{time.time_ns() % 10**9:09d}_{name}_{self.reason}.pstats")
+        stats = pstats.Stats(self.profilers[0])
+        for profiler in self.profilers[1:]:
+            stats.add(profiler)
+        stats.dump_stats(path)
+        return path
+
+
+def profile_reason(request):
+    # "requested" for allowed clients that ask for it, else None
+    requested = request.headers.get("x-profile") == "1" or request.query_params.get("profile") == "1"
+    if requested and request.client is not None and request.client.host in profile_allowlist:
+        return "requested"
+    return None
+
+
+class ProfileMiddleware:
+    # Profiles the handler of a single request, see profile_* in env.example.
+    # A plain ASGI middleware, BaseHTTPMiddleware would add a task group and streams to every request.
+    # The profile is saved when the response starts, sync handlers have returned by then.
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (profile_allowlist or profile_sample_rate > 0):
+            await self.app(scope, receive, send)
+            return
+        profile = RequestProfile(profile_reason(Request(scope)))
+        token = _current_profile.set(profile)
+        saved = False
+
+        def save():
+            nonlocal saved
+            saved = True
+            route = scope.get("route")
+            path = profile.save(route.path if route is not None else "unmatched")
+            if path is not None:
+                print(f"profile of {scope['path']} written to {path}")
+            return path
+
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start":
+                path = save()
+                if path is not None:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-profile-file", os.path.basename(path).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            _current_profile.reset(token)
+            # a handler that raised never started a response
+            if not saved:
+                save()
+
+
+def profiled(func):
+    # runs the handler under cProfile when the current request is profiled.
+    # FastAPI runs sync handlers in a worker thread, so the profiler is started there.
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = _current_profile.get()
+        if profile is None:
+            return func(*args, **kwargs)
+        if profile.reason is None:
+            # every n-th request of the profiled routes is sampled
+            if profile_sample_rate <= 0 or next(_request_counter) % profile_sample_rate != 0:
+                return func(*args, **kwargs)
+            profile.reason = "sampled"
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # since python 3.12 only one profiler can be active at a time (and it sees all threads),
+            # a request that overlaps with another profiled one runs unprofiled
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            profile.add(profiler)
+
+    return wrapper
@@ -0,0 +1,218 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+import numpy as np
+import dotenv
+
+dotenv.load_dotenv()  # load environment variables from .env file
+
+# Compact, read-only copy of my-app/resources/stations.json.
+# All stations are stored as flat numpy arrays in one binary file that is memory mapped,
+# so a worker loads it in milliseconds and forked workers share the same pages.
+# Layout: MAGIC, header length (uint64), JSON header, arrays aligned to 8 bytes.
+# The file is rebuilt whenever stations.json changes.
+
+MAGIC = b"STATSNAP"
+SNAPSHOT_VERSION = 1
+FIELDS = ("id", "brand", "street", "house_number", "zip", "city")
+
+BASE_DIR = Path(__file__).resolve().parent
+stations_json_path = BASE_DIR.parent / "my-app" / "resources" / "stations.json"
+# the directory has to be writable, otherwise the snapshot is only kept in memory
+station_snapshot_path = Path(os.getenv("station_snapshot") or stations_json_path.with_suffix(".snapshot"))
+
+
+def normalize_city(city):
+    return city.strip().lower()
+
+
+def _encode_strings(values):
+    # utf-8 blob and offsets, string i is data[offsets[i]:offsets[i + 1]]
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return offsets, data
+
+
+def _source_stamp(json_path):
+    stat = os.stat(json_path)
+    return {"source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns}
+
+
+def build_snapshot(stations, stamp=None):
+    # returns the snapshot file content for a list of station dicts
+    arrays = {}
+    for field in FIELDS:
+        arrays[f"{field}_offsets"], arrays[f"{field}_data"] = _encode_strings(
+            [s.get(field) or "" for s in stations]
+        )
+
+    ids = np.array([s["id"].encode("utf-8") for s in stations], dtype="S")
+    id_order = np.argsort(ids, kind="stable")
+    arrays["id_sorted"] = ids[id_order]
+    arrays["id_order"] = id_order.astype(np.int32)
+
+    zips = np.array([(s.get("zip") or "").strip().encode("utf-8") for s in stations], dtype="S")
+    zip_order = np.argsort(zips, kind="stable")
+    arrays["zip_sorted"] = zips[zip_order]
+    arrays["zip_order"] = zip_order.astype(np.int32)
+
+    # stations grouped by normalized city, in the order of stations.json
+    by_city = {}
+    for i, s in enumerate(stations):
+        if s.get("city"):
+            by_city.setdefault(normalize_city(s["city"]).encode("utf-8"), []).append(i)
+    # sorted by utf-8 bytes, so a lookup can bisect over the encoded keys
+    city_keys = sorted(by_city)
+    arrays["city_key_offsets"], arrays["city_key_data"] = _encode_strings(
+        [key.decode("utf-8") for key in city_keys]
+    )
+    arrays["city_starts"] = np.zeros(len(city_keys) + 1, dtype=np.int32)
+    np.cumsum([len(by_city[key]) for key in city_keys], out=arrays["city_starts"][1:])
+    arrays["city_stations"] = np.array(
+        [i for key in city_keys for i in by_city[key]], dtype=np.int32
+    )
+
+    header = {"version": SNAPSHOT_VERSION, "count": len(stations), **(stamp or {}), "arrays": {}}
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = {"offset": offset, "dtype": array.dtype.str, "shape": list(array.shape)}
+        offset += -(-array.nbytes // 8) * 8
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    # the arrays start at a multiple of 8 bytes
+    header_bytes += b" " * (-(len(MAGIC) + 8 + len(header_bytes)) % 8)
+    parts = [MAGIC, np.uint64(len(header_bytes)).tobytes(), header_bytes]
+    for array in arrays.values():
+        data = np.ascontiguousarray(array).tobytes()
+        parts.append(data + b"\0" * (-len(data) % 8))
+    return b"".join(parts)
+
+
+def write_snapshot(json_path, snapshot_path):
+    with open(json_path, "r", encoding="utf-8") as f:
+        stations = json.load(f)
+    content = build_snapshot(stations, _source_stamp(json_path))
+    # write to a temporary file and rename it, so other workers never see a half written file
+    directory = os.path.dirname(os.path.abspath(snapshot_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".stations-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        # mkstemp creates the file readable by the owner only
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, snapshot_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return content
+
+
+class StationSnapshot:
+    def __init__(self, buffer):
+        buffer = np.asarray(buffer, dtype=np.uint8)
+        if bytes(buffer[: len(MAGIC)]) != MAGIC:
+            raise ValueError("not a station snapshot")
+        header_length = int(buffer[len(MAGIC) : len(MAGIC) + 8].view(np.uint64)[0])
+        start = len(MAGIC) + 8
+        self.header = json.loads(bytes(buffer[start : start + header_length]))
+        if self.header["version"] != SNAPSHOT_VERSION:
+            raise ValueError(f"unsupported station snapshot version {self.header['version']}")
+
+        start += header_length
+        self.arrays = {}
+        for name, spec in self.header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"], dtype=np.int64))
+            offset = start + spec["offset"]
+            self.arrays[name] = buffer[offset : offset + count * dtype.itemsize].view(dtype).reshape(spec["shape"])
+        self.count = self.header["count"]
+
+    @classmethod
+    def open(cls, snapshot_path):
+        return cls(np.memmap(snapshot_path, dtype=np.uint8, mode="r"))
+
+    @classmethod
+    def load(cls, json_path, snapshot_path):
+        # memory map the snapshot, (re)build it first if stations.json changed
+        json_path = Path(json_path)
+        snapshot_path = Path(snapshot_path)
+        if snapshot_path.exists():
+            snapshot = cls.open(snapshot_path)
+            if not json_path.exists():
+                return snapshot
+            stamp = _source_stamp(json_path)
+            if all(snapshot.header.get(key) == value for key, value in stamp.items()):
+                return snapshot
+        try:
+            write_snapshot(json_path, snapshot_path)
+        except OSError as e:
+            # e.g. a read only deployment, keep the snapshot in memory instead
+            print(f"Could not write station snapshot {snapshot_path}: {e}")
+            with open(json_path, "r", encoding="utf-8") as f:
+                return cls(np.frombuffer(build_snapshot(json.load(f)), dtype=np.uint8))
+        print(f"Built station snapshot {snapshot_path}")
+        return cls.open(snapshot_path)
+
+    def _strings(self, name, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        offsets = self.arrays[f"{name}_offsets"]
+        # memoryview slices are cheaper than numpy slices for many short strings
+        data = memoryview(self.arrays[f"{name}_data"])
+        return [
+            str(data[start:end], "utf-8")
+            for start, end in zip(offsets[indices].tolist(), offsets[indices + 1].tolist())
+        ]
+
+    def stations(self, indices):
+        # station dicts like in stations.json, strings are decoded column by column
+        columns = [self._strings(field, indices) for field in FIELDS]
+        return [dict(zip(FIELDS, values)) for values in zip(*columns)]
+
+    def station(self, i):
+        return self.stations([i])[0]
+
+    def station_ids(self, indices):
+        return self._strings("id", indices)
+
+    def index_of(self, station_id):
+        # position of the station in stations.json, None for unknown ids
+        id_sorted = self.arrays["id_sorted"]
+        key = station_id.encode("utf-8")
+        i = int(np.searchsorted(id_sorted, key))
+        if i < len(id_sorted) and id_sorted[i] == key:
+            return int(self.arrays["id_order"][i])
+        return None
+
+    def stations_in_city(self, city):
+        # indices of all stations in the city, same matching as before: stripped and case insensitive
+        key = normalize_city(city).encode("utf-8")
+        offsets = self.arrays["city_key_offsets"]
+        data = self.arrays["city_key_data"]
+        low, high = 0, len(offsets) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if data[offsets[middle] : offsets[middle + 1]].tobytes() < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == len(offsets) - 1 or data[offsets[low] : offsets[low + 1]].tobytes() != key:
+            return []
+        starts = self.arrays["city_starts"]
+        return self.arrays["city_stations"][starts[low] : starts[low + 1]].tolist()
+
+    def stations_in_zip(self, zip_code):
+        zip_sorted = self.arrays["zip_sorted"]
+        key = zip_code.strip().encode("utf-8")
+        low = int(np.searchsorted(zip_sorted, key, side="left"))
+        high = int(np.searchsorted(zip_sorted, key, side="right"))
+        return self.arrays["zip_order"][low:high].tolist()
+
+
+if __name__ == "__main__":
+    # build the snapshot ahead of deployment: python -m APIs.station_snapshot
+    write_snapshot(stations_json_path, station_snapshot_path)
+    snapshot = StationSnapshot.open(station_snapshot_path)
+    print(f"{snapshot.count} stations written to {station_snapshot_path}")
@@ -1,45 +1,223 @@
-import json
 import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 import dotenv
-from pathlib import Path
+from APIs.monitoring import Counter, FunctionGauge, Histogram
+from APIs.price_history import price_history
+from APIs.station_snapshot import StationSnapshot, station_snapshot_path, stations_json_path
 
 dotenv.load_dotenv()  # load environment variables from .env file
 tk_api_key = os.getenv("api_key")
 
-BASE_DIR = Path(__file__).resolve().parent
-file_path = BASE_DIR.parent / "my-app" / "resources" / "stations.json"
+# point this to a local stub of prices.php for testing
+tk_base_url = os.getenv("tk_base_url", "https://creativecommons.tankerkoenig.de/json")
+# number of chunks fetched at the same time
+tk_max_workers = int(os.getenv("tk_max_workers", "8"))
+# seconds until a single call to the TK API is aborted
+tk_timeout = float(os.getenv("tk_timeout", "5"))
+tk_retries = int(os.getenv("tk_retries", "2"))
+tk_backoff = float(os.getenv("tk_backoff", "0.5"))
+# calls per second to the TK API over all requests of this process, 0 disables the limit.
+# the budget is per worker process, n gunicorn workers make up to n times as many calls
+tk_rate_limit = float(os.getenv("tk_rate_limit", "5"))
+# calls that may be made at once before the rate applies, a cold Berlin (309 stations, 31 chunks) fits
+tk_rate_burst = float(os.getenv("tk_rate_burst", "40"))
+# seconds a fetched price is served from the cache
+tk_cache_ttl = float(os.getenv("tk_cache_ttl", "120"))
+
+# stations are memory mapped from a compact snapshot of stations.json instead of parsed per worker
+stations = StationSnapshot.load(stations_json_path, station_snapshot_path)
+
+
+class RateLimiter:
+    # token bucket shared by all threads, allows short bursts up to `burst` calls
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# keep-alive connections are reused by all chunks and requests
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=1, pool_maxsize=tk_max_workers)
+session.mount("https://", adapter)
+session.mount("http://", adapter)
+
+executor = ThreadPoolExecutor(max_workers=tk_max_workers, thread_name_prefix="tk")
+rate_limiter = RateLimiter(tk_rate_limit, tk_rate_burst)
+
+upstream_requests = Counter(
+    "tk_upstream_requests_total", "Calls to the TK prices API by status code", ["status"]
+)
+upstream_latency = Histogram("tk_upstream_request_seconds", "Latency of calls to the TK prices API")
+upstream_chunks = Histogram(
+    "tk_upstream_chunks", "Chunks of 10 ids fetched per stations request", buckets=(0, 1, 2, 5, 10, 20, 50, 100)
+)
+
+
+def fetch_prices(station_ids):
+    # tk price request format: https://creativecommons.tankerkoenig.de/json/prices.php?ids=ID1,ID2,...,ID10&apikey=APIKEY
+    url = f"{tk_base_url}/prices.php?ids={','.join(station_ids)}&apikey={tk_api_key}"
+    error = None
+    for attempt in range(tk_retries + 1):
+        if attempt > 0:
+            time.sleep(tk_backoff * 2 ** (attempt - 1))
+        rate_limiter.acquire()
+        start = time.perf_counter()
+        try:
+            response = session.get(url, timeout=tk_timeout)
+        except requests.RequestException as e:
+            upstream_requests.inc(("error",))
+            upstream_latency.observe(time.perf_counter() - start)
+            error = e
+            continue
+        upstream_requests.inc((str(response.status_code),))
+        upstream_latency.observe(time.perf_counter() - start)
+        if response.status_code == 200:
+            try:
+                return response.json().get("prices", {})
+            except ValueError as e:
+                error = e
+                continue
+        error = response.status_code
+        # only rate limiting and server errors are worth another try
+        if response.status_code != 429 and response.status_code < 500:
+            break
+    print(f"Error fetching data from TK API: {error}")
+    # None tells the cache that nothing was fetched, in contrast to an empty result
+    return None
+
+
+def split_chunks(station_ids, size=10):
+    return [station_ids[i:i + size] for i in range(0, len(station_ids), size)]
+
+
+def record_prices(prices):
+    # every fetched price goes into the price history, a failure there must not fail the request
+    if price_history is None:
+        return
+    try:
+        price_history.record(prices)
+    except OSError as e:
+        print(f"Error recording price history: {e}")
+
+
+class PriceCache:
+    # shared price cache keyed by station id. Ids that are already being fetched by
+    # another request are not requested again, the request waits for that fetch instead.
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        # station_id -> (expires_at, info), info is None for ids unknown to the TK API
+        self.entries = {}
+        # station_id -> Future of the fetch that is currently running for it
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get_prices(self, station_ids):
+        prices = {}
+        own = {}
+        waiting = {}
+        now = time.monotonic()
+        with self.lock:
+            for station_id in station_ids:
+                entry = self.entries.get(station_id)
+                if entry is not None and entry[0] > now:
+                    self.hits += 1
+                    prices[station_id] = entry[1]
+                elif station_id in self.inflight:
+                    self.coalesced += 1
+                    waiting[station_id] = self.inflight[station_id]
+                elif station_id not in own:
+                    self.misses += 1
+                    own[station_id] = self.inflight[station_id] = Future()
+
+        # only the misses are chunked and fetched
+        chunks = split_chunks(list(own))
+        upstream_chunks.observe(len(chunks))
+        if own:
+            try:
+                for chunk, result in zip(chunks, executor.map(fetch_prices, chunks)):
+                    expires_at = time.monotonic() + self.ttl
+                    if result:
+                        record_prices(result)
+                    with self.lock:
+                        for station_id in chunk:
+                            info = result.get(station_id) if result is not None else None
+                            # failed fetches are not cached so the next request tries again
+                            if result is not None:
+                                self.entries[station_id] = (expires_at, info)
+                            del self.inflight[station_id]
+                            own[station_id].set_result(info)
+                            prices[station_id] = info
+            finally:
+                # never leave waiting requests hanging if the fetch raised
+                with self.lock:
+                    for station_id, future in own.items():
+                        if not future.done():
+                            del self.inflight[station_id]
+                            future.set_result(None)
+
+        for station_id, future in waiting.items():
+            prices[station_id] = future.result()
+
+        return {station_id: info for station_id, info in prices.items() if info is not None}
+
+
+price_cache = PriceCache(tk_cache_ttl)
+
+FunctionGauge("tk_price_cache_hits_total", "Station prices served from the cache", lambda: price_cache.hits, "counter")
+FunctionGauge("tk_price_cache_misses_total", "Station prices fetched from the TK API", lambda: price_cache.misses, "counter")
+FunctionGauge(
+    "tk_price_cache_coalesced_total",
+    "Station prices that waited for a fetch of another request",
+    lambda: price_cache.coalesced,
+    "counter",
+)
 
-with open(file_path, "r", encoding="utf-8") as f:
-    stations = json.load(f)
 
 def get_info_from_station(city):
     # get all stations in city
-    stations_in_city = [s for s in stations if s.get("city") and s["city"].strip().lower() == city.strip().lower()]
+    stations_in_city = stations.stations_in_city(city)
     # get all ids of stations in city
-    station_ids = [s["id"] for s in stations_in_city]
+    station_ids = stations.station_ids(stations_in_city)
 
-    #tk price request format: https://creativecommons.tankerkoenig.de/json/prices.php?ids=ID1,ID2,...,ID10&apikey=APIKEY
-    # split station ids into chunks of 10
-    station_id_chunks = [station_ids[i:i + 10] for i in range(0, len(station_ids), 10)]
+    # cached prices are reused, the rest is fetched concurrently in chunks of 10
+    prices = price_cache.get_prices(station_ids)
+    found = [(index, station_id) for index, station_id in zip(stations_in_city, station_ids) if station_id in prices]
     station_info = []
-    for chunk in station_id_chunks:
-        ids_str = ",".join(chunk)
-        url = f"https://creativecommons.tankerkoenig.de/json/prices.php?ids={ids_str}&apikey={tk_api_key}"
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            for station_id, info in data.get("prices", {}).items():
-                station_info.append({
-                    "id": station_id,
-                    "brand": next((s["brand"] for s in stations_in_city if s["id"] == station_id), "Unknown"),
-                    "e5": info.get("e5"),
-                    "e10": info.get("e10"),
-                    "diesel": info.get("diesel"),
-                    "status": info.get("status", "unknown"),
-                    "street": next((s["street"] for s in stations_in_city if s["id"] == station_id), "Unknown"),
-                    "house_number": next((s["house_number"] for s in stations_in_city if s["id"] == station_id), "Unknown"),
-                })
-        else:
-            print(f"Error fetching data from TK API: {response.status_code}")
+    for (index, station_id), station in zip(found, stations.stations([index for index, _ in found])):
+        info = prices[station_id]
+        station_info.append({
+            "id": station_id,
+            "brand": station["brand"],
+            "e5": info.get("e5"),
+            "e10": info.get("e10"),
+            "diesel": info.get("diesel"),
+            "status": info.get("status", "unknown"),
+            "street": station["street"],
+            "house_number": station["house_number"],
+        })
     return station_info
@@ -0,0 +1,300 @@
+# Benchmarks for the model, feature engineering and API hot paths.
+# Run from the repository root:
+#   python benchmarks/bench.py --output bench_results.json
+#   python benchmarks/bench.py --quick --compare bench_results.json
+# All data is synthetic with fixed seeds, the TK API is replaced by a local stub server.
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from model.mlp import MLP, InferenceEngine
+from model.data_processing import DataLoader, FeatureEngineer
+
+SEED = 42
+BRANDS = ["Aral", "Jet", "Shell", "Total", "Esso", "Bft", "Star", "OIL!"]
+
+
+def measure(fn, repeat=5, warmup=1):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {"min_s": min(times), "median_s": statistics.median(times), "repeat": repeat}
+
+
+def make_raw_prices(n_rows, n_stations=15000, seed=SEED):
+    # a day of price changes in the layout of the Tankerkoenig dumps
+    rng = np.random.default_rng(seed)
+    seconds = np.sort(rng.integers(0, 86400, n_rows))
+    dates = pd.Timestamp("2026-01-12", tz="Europe/Berlin") + pd.to_timedelta(seconds, unit="s")
+    return pd.DataFrame(
+        {
+            "date": dates.strftime("%Y-%m-%d %H:%M:%S%z"),
+            "station_uuid": rng.choice([f"station-{i}" for i in range(n_stations)], n_rows),
+            "diesel": np.round(rng.normal(1.65, 0.05, n_rows), 3),
+            "e5": np.round(rng.normal(1.75, 0.05, n_rows), 3),
+            "e10": np.round(rng.normal(1.69, 0.05, n_rows), 3),
+            "dieselchange": rng.integers(0, 2, n_rows),
+            "e5change": rng.integers(0, 2, n_rows),
+            "e10change": rng.integers(0, 2, n_rows),
+        }
+    )
+
+
+def make_clean_data(n_rows, n_stations=15000, seed=SEED):
+    # the object matrix clean_data returns: [date],[station_uuid],[diesel],[e5],[e10],...
+    rng = np.random.default_rng(seed)
+    seconds = np.sort(rng.integers(0, 86400, n_rows))
+    dates = pd.Timestamp("2026-01-12", tz="UTC") + pd.to_timedelta(seconds, unit="s")
+    data = np.empty((n_rows, 8), dtype=object)
+    data[:, 0] = list(dates)
+    data[:, 1] = rng.choice([f"station-{i}" for i in range(n_stations)], n_rows)
+    data[:, 2:5] = np.round(rng.normal(1.7, 0.05, (n_rows, 3)), 3)
+    data[:, 5:] = rng.integers(0, 2, (n_rows, 3))
+    return data
+
+
+def make_stations(n_stations=15000, seed=SEED):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "uuid": [f"station-{i}" for i in range(n_stations)],
+            "city": [f"city-{i}" for i in rng.integers(0, 1500, n_stations)],
+            "brand": rng.choice(BRANDS, n_stations),
+        }
+    )
+
+
+def bench_mlp(results, batch_sizes):
+    rng = np.random.default_rng(SEED)
+    np.random.seed(SEED)
+    mlp = MLP(7, 16, 2, 1)
+    engine = InferenceEngine(mlp)
+    for batch_size in batch_sizes:
+        X = rng.random((batch_size, 7))
+        y = rng.random((batch_size, 1))
+        repeat = max(5, min(1000, 200_000 // batch_size))
+        params = {"batch_size": batch_size}
+
+        results.append({"name": "mlp.forward", "params": params, **measure(lambda: mlp.forward(X), repeat)})
+
+        def forward_backward():
+            mlp.backward(y, mlp.forward(X))
+
+        results.append({"name": "mlp.forward_backward", "params": params, **measure(forward_backward, repeat)})
+        X32 = X.astype(np.float32)
+        results.append({"name": "inference_engine.predict", "params": params, **measure(lambda: engine.predict(X32), repeat)})
+
+
+def bench_features(results, sizes, work_dir):
+    stations = make_stations()
+    # create_brand_one_hot reads uuid_to_brand.csv from the working directory
+    stations.rename(columns={"uuid": "id"})[["id", "brand"]].to_csv(
+        os.path.join(work_dir, "uuid_to_brand.csv"), index=False
+    )
+    for n_rows in sizes:
+        data = make_clean_data(n_rows)
+        params = {"rows": n_rows}
+        repeat = 3 if n_rows < 1_000_000 else 1
+        engineer = FeatureEngineer(data)
+
+        results.append({
+            "name": "features.create_time_features",
+            "params": params,
+            **measure(lambda: FeatureEngineer.create_time_features(data[:, 0]), repeat),
+        })
+        results.append({
+            "name": "features.create_average_price_feature",
+            "params": params,
+            **measure(lambda: FeatureEngineer.create_average_price_feature(data, 3, stations), repeat),
+        })
+        results.append({
+            "name": "features.create_price_min_24h_features",
+            "params": params,
+            **measure(engineer.create_price_min_24h_features, repeat),
+        })
+
+        def brand_one_hot():
+            cwd = os.getcwd()
+            os.chdir(work_dir)
+            try:
+                engineer.create_brand_one_hot(data[:, 1])
+            finally:
+                os.chdir(cwd)
+
+        results.append({"name": "features.create_brand_one_hot", "params": params, **measure(brand_one_hot, repeat)})
+
+        raw = make_raw_prices(n_rows)
+        # clean_data modifies its input, every run gets a fresh copy
+        results.append({
+            "name": "data_loader.clean_data",
+            "params": params,
+            **measure(lambda: DataLoader.clean_data(raw.copy()), repeat),
+        })
+
+
+class StubPricesHandler(BaseHTTPRequestHandler):
+    # answers prices.php like the TK API with fixed prices for every requested id
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        ids = parse_qs(urlparse(self.path).query).get("ids", [""])[0].split(",")
+        prices = {
+            station_id: {"status": "open", "e5": 1.759, "e10": 1.699, "diesel": 1.649}
+            for station_id in ids
+            if station_id
+        }
+        body = json.dumps({"ok": True, "prices": prices}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def bench_api(results, repeat):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubPricesHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # configure the TK client before it is imported
+    os.environ["tk_base_url"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["tk_rate_limit"] = "0"
+    os.environ["tk_cache_ttl"] = "0"
+    # no price history, the timings would include its disk writes
+    os.environ["price_history_dir"] = ""
+
+    from fastapi.testclient import TestClient
+    from APIs.predict import app
+    from APIs.tk_client import price_cache
+
+    try:
+        with TestClient(app) as client:
+            for path in ["/predict/e5", "/predict?fuel_types=e5,e10,diesel&horizon_hours=48&step_minutes=15"]:
+                results.append({
+                    "name": "api.predict",
+                    "params": {"path": path},
+                    **measure(lambda: client.get(path), repeat),
+                })
+            for query in ["Mün", "frnakfurt", "101"]:
+                results.append({
+                    "name": "api.autocomplete",
+                    "params": {"q": query},
+                    **measure(lambda: client.get("/autocomplete", params={"q": query}), repeat),
+                })
+            for city in ["Berlin", "Alsfeld"]:
+                path = f"/stations/{city}"
+                price_cache.ttl = 0
+                results.append({
+                    "name": "api.stations.uncached",
+                    "params": {"path": path},
+                    **measure(lambda: client.get(path), repeat),
+                })
+                price_cache.ttl = 3600
+                results.append({
+                    "name": "api.stations.cached",
+                    "params": {"path": path},
+                    **measure(lambda: client.get(path), repeat),
+                })
+    finally:
+        server.shutdown()
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+def key(result):
+    return result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {key(r): r for r in json.load(f)["results"]}
+    print(f"\n{'benchmark':<45} {'params':<40} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for result in results:
+        old = baseline.get(key(result))
+        if old is None:
+            continue
+        ratio = result["min_s"] / old["min_s"]
+        print(
+            f"{result['name']:<45} {key(result)[1]:<40} "
+            f"{old['min_s'] * 1e3:>8.3f}ms {result['min_s'] * 1e3:>8.3f}ms {ratio:>6.2f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the model, features and API")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="results file of an earlier run")
+    parser.add_argument("--quick", action="store_true", help="small sizes only")
+    parser.add_argument("--only", choices=["mlp", "features", "api"], action="append")
+    args = parser.parse_args()
+
+    sizes = [10_000, 100_000] if args.quick else [10_000, 100_000, 1_000_000]
+    batch_sizes = [1, 64, 1024] if args.quick else [1, 64, 1024, 16384]
+    groups = args.only or ["mlp", "features", "api"]
+
+    results = []
+    if "mlp" in groups:
+        print("benchmarking mlp...")
+        bench_mlp(results, batch_sizes)
+    if "features" in groups:
+        print("benchmarking feature engineering...")
+        with tempfile.TemporaryDirectory() as work_dir:
+            bench_features(results, sizes, work_dir)
+    if "api" in groups:
+        print("benchmarking api...")
+        bench_api(results, repeat=20 if args.quick else 100)
+
+    for result in results:
+        print(f"{result['name']:<45} {json.dumps(result['params']):<40} {result['min_s'] * 1e3:>10.3f}ms")
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "seed": SEED,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
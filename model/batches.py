@@ -0,0 +1,137 @@
+import queue
+import threading
+import numpy as np
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+def prefetch(iterable, size):
+    # iterates over iterable in a background thread, at most size items wait in the queue.
+    # errors of the thread are raised in the consumer, leaving the loop early stops the thread
+    items = queue.Queue(maxsize=size)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_Failure(e))
+        finally:
+            # stops the threads of nested prefetches as well
+            if hasattr(iterable, "close"):
+                iterable.close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+
+class ShardedBatches:
+    # Out-of-core mini-batches for Trainer.train_epoch and metrics.evaluate.
+    # The rows are split into shards of shard_rows consecutive rows, so the disk is only read
+    # sequentially. Every epoch the shard order is shuffled, buffer_shards shards are loaded
+    # together and their rows are shuffled in memory. One thread loads the next buffer while
+    # another one cuts the current buffer into float32 batches and queues up to `prefetch`
+    # of them, so reading, shuffling and training overlap.
+    # X and y are usually the memory mapped arrays of DataLoader.load_feature_store,
+    # y can also be a list of label columns that are read separately.
+
+    def __init__(
+        self,
+        X,
+        y,
+        batch_size=1024,
+        shard_rows=1 << 20,
+        buffer_shards=4,
+        prefetch=8,
+        shuffle=True,
+        dtype=np.float32,
+        seed=None,
+    ):
+        self.X = X
+        self.y = y
+        self.batch_size = batch_size
+        self.shard_rows = shard_rows
+        self.buffer_shards = buffer_shards
+        self.prefetch = prefetch
+        self.shuffle = shuffle
+        self.dtype = dtype
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return len(self.X)
+
+    @property
+    def n_outputs(self):
+        if isinstance(self.y, (list, tuple)):
+            return len(self.y)
+        return self.y.shape[1] if self.y.ndim > 1 else 1
+
+    def _read(self, start, end, stride=1):
+        # rows start:end as float32, y with shape [rows, n_outputs]
+        X = np.asarray(self.X[start:end:stride], dtype=self.dtype)
+        if isinstance(self.y, (list, tuple)):
+            y = np.column_stack([np.asarray(column[start:end:stride], dtype=self.dtype) for column in self.y])
+        else:
+            y = np.asarray(self.y[start:end:stride], dtype=self.dtype).reshape(len(X), -1)
+        return X, y
+
+    def _buffers(self, shards):
+        for group in shards:
+            parts = [self._read(start, end) for start, end in group]
+            yield np.concatenate([X for X, _ in parts]), np.concatenate([y for _, y in parts])
+
+    def _batches(self, shards, rng):
+        for X, y in prefetch(self._buffers(shards), 1):
+            order = rng.permutation(len(X)) if self.shuffle else np.arange(len(X))
+            for i in range(0, len(X), self.batch_size):
+                index = order[i : i + self.batch_size]
+                yield X[index], y[index]
+
+    def epoch(self):
+        # shuffled batches over all rows, the last batch of every buffer may be smaller
+        shards = [(start, min(start + self.shard_rows, len(self))) for start in range(0, len(self), self.shard_rows)]
+        if self.shuffle:
+            shards = [shards[i] for i in self.rng.permutation(len(shards))]
+        groups = [shards[i : i + self.buffer_shards] for i in range(0, len(shards), self.buffer_shards)]
+        # the batch thread gets its own generator, seeded from the main one for reproducible epochs
+        rng = np.random.default_rng(self.rng.integers(2**63))
+        return prefetch(self._batches(groups, rng), self.prefetch)
+
+    def __iter__(self):
+        return self.epoch()
+
+    def chunks(self, chunk_size=65536, stride=1):
+        # every stride-th row in file order, for evaluation
+        def read():
+            step = chunk_size * stride
+            for start in range(0, len(self), step):
+                yield self._read(start, min(start + step, len(self)), stride)
+
+        return prefetch(read(), 2)
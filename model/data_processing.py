@@ -1,9 +1,157 @@
 # This file creates features from the raw data
 
-import pandas as pd
-import numpy as np
+import contextlib
+import datetime
+import hashlib
+import json
 import numpy as np
 import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+# pandas is imported by the functions that need it, so serving the time features only needs numpy
+
+# additional days treated as holidays, the 2026 list the current models were trained with
+HOLIDAYS = [
+    "2026-01-01",
+    "2026-02-11",
+    "2026-02-12",
+    "2026-02-13",
+    "2026-02-14",
+    "2026-02-15",
+    "2026-03-17",
+    "2026-04-06",
+    "2026-05-01",
+    "2026-06-14",
+    "2026-09-29",
+    "2026-10-01",
+    "2026-10-02",
+    "2026-10-03",
+    "2026-10-04",
+    "2026-10-05",
+    "2026-11-02",
+    "2026-12-25",
+]
+
+# public holidays in every state, (month, day) and days relative to easter sunday
+NATIONWIDE_FIXED_HOLIDAYS = [(1, 1), (5, 1), (10, 3), (12, 25), (12, 26)]
+NATIONWIDE_EASTER_HOLIDAYS = [-2, 1, 39, 50]
+
+# additional public holidays per state: (month, day) or easter offset, and the first year it applies
+STATE_HOLIDAYS = {
+    "BW": [((1, 6), 1900), (60, 1900), ((11, 1), 1900)],
+    "BY": [((1, 6), 1900), (60, 1900), ((11, 1), 1900)],
+    "BE": [((3, 8), 2019)],
+    "BB": [((10, 31), 1900)],
+    "HB": [((10, 31), 2018)],
+    "HH": [((10, 31), 2018)],
+    "HE": [(60, 1900)],
+    "MV": [((10, 31), 1900), ((3, 8), 2023)],
+    "NI": [((10, 31), 2018)],
+    "NW": [(60, 1900), ((11, 1), 1900)],
+    "RP": [(60, 1900), ((11, 1), 1900)],
+    "SL": [(60, 1900), ((8, 15), 1900), ((11, 1), 1900)],
+    "SN": [((10, 31), 1900), ("repentance", 1900)],
+    "ST": [((1, 6), 1900), ((10, 31), 1900)],
+    "SH": [((10, 31), 2018)],
+    "TH": [((10, 31), 1900), ((9, 20), 2019)],
+}
+
+
+def easter_sunday(year):
+    # anonymous gregorian algorithm
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return datetime.date(year, month, day + 1)
+
+
+def german_holidays(year, state=None):
+    easter = easter_sunday(year)
+    rules = [(date, 0) for date in NATIONWIDE_FIXED_HOLIDAYS]
+    rules += [(offset, 0) for offset in NATIONWIDE_EASTER_HOLIDAYS]
+    if state is not None:
+        rules += STATE_HOLIDAYS[state]
+
+    days = []
+    for rule, since in rules:
+        if year < since:
+            continue
+        if rule == "repentance":
+            # wednesday before november 23
+            nov_22 = datetime.date(year, 11, 22)
+            days.append(nov_22 - datetime.timedelta(days=(nov_22.weekday() - 2) % 7))
+        elif isinstance(rule, int):
+            days.append(easter + datetime.timedelta(days=rule))
+        else:
+            days.append(datetime.date(year, *rule))
+    return days
+
+
+class HolidayCalendar:
+    # holidays stored as sorted day ordinals (days since 1970-01-01) for vectorized lookups
+
+    def __init__(self, days):
+        self.ordinals = np.unique(np.asarray(days, dtype="datetime64[D]").astype(np.int64))
+
+    @classmethod
+    def german(cls, first_year=2015, last_year=2035, state=None, extra_days=HOLIDAYS):
+        days = [
+            day
+            for year in range(first_year, last_year + 1)
+            for day in german_holidays(year, state)
+        ]
+        days += [datetime.date.fromisoformat(day) for day in extra_days]
+        return cls(days)
+
+    def is_holiday(self, day_ordinals):
+        day_ordinals = np.asarray(day_ordinals, dtype=np.int64)
+        if len(self.ordinals) == 0:
+            return np.zeros(day_ordinals.shape, dtype=bool)
+        index = np.searchsorted(self.ordinals, day_ordinals)
+        index = np.minimum(index, len(self.ordinals) - 1)
+        return self.ordinals[index] == day_ordinals
+
+
+# nationwide calendar used for the time features
+HOLIDAY_CALENDAR = HolidayCalendar.german()
+
+# bump whenever create_feature_matrix changes, cached feature shards of older versions are ignored
+FEATURE_SET_VERSION = 2
+
+# columns created by create_time_features
+TIME_FEATURE_NAMES = [
+    "time_sin",
+    "time_cos",
+    "day_sin",
+    "day_cos",
+    "is_weekend",
+    "is_holiday",
+    "is_day_before_holiday",
+]
+
+# columns created by create_feature_matrix
+FEATURE_NAMES = list(TIME_FEATURE_NAMES)
+
+# price column of every fuel type in the raw data
+FUEL_COLUMNS = {"diesel": 2, "e5": 3, "e10": 4}
+
+# columns and dtypes read by the streaming ingestion, the change columns are not used
+RAW_COLUMNS = ["date", "station_uuid", "diesel", "e5", "e10"]
+RAW_DTYPES = {
+    "date": str,
+    "station_uuid": "category",
+    "diesel": np.float32,
+    "e5": np.float32,
+    "e10": np.float32,
+}
 
 
 class DataLoader:
@@ -11,7 +159,17 @@ class DataLoader:
         self.file_path = file_path
 
     @staticmethod
-    def load_data(file_path, rows=None, columns=None):
+    def load_data(file_path, rows=None, columns=None, mmap_mode="r"):
+        # .npy files are memory mapped instead of parsed
+        if str(file_path).endswith(".npy"):
+            data = np.load(file_path, mmap_mode=mmap_mode)
+            if rows is not None:
+                data = data[rows]
+            if columns is not None:
+                data = data[:, columns]
+            return data
+        import pandas as pd
+
         data = pd.read_csv(file_path)
         if rows is not None:
             data = data.iloc[rows]
@@ -21,10 +179,103 @@ class DataLoader:
 
     @staticmethod
     def save_data(data: np.array, destination):
+        if str(destination).endswith(".npy"):
+            np.save(destination, data)
+            return
+        import pandas as pd
+
         pd.DataFrame(data).to_csv(destination, index=False)
 
+    # Feature store layout:
+    # directory/X.npy          float32 feature matrix, shape [rows, features]
+    # directory/y_{label}.npy  one float32 file per label column, shape [rows]
+    # directory/manifest.json  shapes, dtypes and names of all files
+
+    @staticmethod
+    def save_feature_store(X, y, directory, label_names, feature_names=None):
+        DataLoader.save_feature_store_shards([(X, y)], directory, label_names, feature_names)
+
+    @staticmethod
+    def save_feature_store_shards(shards, directory, label_names, feature_names=None, block_rows=1 << 20):
+        # same store as save_feature_store from a list of (X, y) parts, e.g. memory mapped day shards.
+        # the parts are copied block by block into the memory mapped files, so memory does not grow with the rows
+        os.makedirs(directory, exist_ok=True)
+        shards = [(X, np.asarray(y).reshape(len(X), -1)) for X, y in shards if len(X) > 0]
+        for X, y in shards:
+            if y.shape[1] != len(label_names):
+                raise ValueError(f"got {y.shape[1]} label columns but {len(label_names)} label names")
+        rows = sum(len(X) for X, _ in shards)
+        n_features = shards[0][0].shape[1] if shards else 0
+
+        manifest = {
+            "feature_set_version": FEATURE_SET_VERSION,
+            "rows": rows,
+            "features": {
+                "file": "X.npy",
+                "shape": [rows, n_features],
+                "dtype": "float32",
+                "names": list(feature_names) if feature_names is not None else None,
+            },
+            "labels": {},
+        }
+        X_out = np.lib.format.open_memmap(
+            os.path.join(directory, "X.npy"), "w+", np.float32, (rows, n_features)
+        )
+        y_out = []
+        for name in label_names:
+            file_name = f"y_{name}.npy"
+            y_out.append(np.lib.format.open_memmap(os.path.join(directory, file_name), "w+", np.float32, (rows,)))
+            manifest["labels"][name] = {"file": file_name, "shape": [rows], "dtype": "float32"}
+
+        offset = 0
+        for X, y in shards:
+            if X.shape[1] != n_features:
+                raise ValueError(f"got {X.shape[1]} features but {n_features} in the first part")
+            for start in range(0, len(X), block_rows):
+                end = min(start + block_rows, len(X))
+                X_out[offset + start : offset + end] = X[start:end]
+                for i, column in enumerate(y_out):
+                    column[offset + start : offset + end] = y[start:end, i]
+            offset += len(X)
+        for array in [X_out, *y_out]:
+            array.flush()
+        del X_out, y_out
+
+        # the manifest is written last, a store without manifest is incomplete
+        with open(os.path.join(directory, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+    @staticmethod
+    def load_feature_store(directory, labels=None, mmap_mode="r", stack_labels=True):
+        # returns X [rows, features] and y [rows, len(labels)], only the requested label files are opened.
+        # stack_labels=False returns y as a list of memory mapped label columns instead of copying them into one array
+        with open(os.path.join(directory, "manifest.json")) as f:
+            manifest = json.load(f)
+
+        X = np.load(os.path.join(directory, manifest["features"]["file"]), mmap_mode=mmap_mode)
+
+        if labels is None:
+            labels = list(manifest["labels"])
+        columns = []
+        for name in labels:
+            if name not in manifest["labels"]:
+                raise KeyError(f"label {name} not in feature store {directory}")
+            file_name = manifest["labels"][name]["file"]
+            columns.append(np.load(os.path.join(directory, file_name), mmap_mode=mmap_mode))
+
+        if not stack_labels:
+            return X, columns
+        # a single label stays a zero-copy view of its file
+        if len(columns) == 1:
+            y = columns[0].reshape(-1, 1)
+        else:
+            y = np.column_stack(columns)
+        return X, y
+
     @staticmethod
     def clean_data(data):
+        import pandas as pd
+
         # parse datetime column and coerce errors to NaT
         data.iloc[:, 0] = pd.to_datetime(data.iloc[:, 0], errors="coerce", utc=True)
         data = data.dropna(subset=[data.columns[0]])
@@ -44,6 +295,65 @@ class DataLoader:
         data = data[(data[:, 2] != 0) & (data[:, 3] != 0) & (data[:, 4] != 0)]
         return data
 
+    @staticmethod
+    def read_raw_chunks(file_path, chunksize=500_000):
+        # typed chunks of a raw daily dump: parsed dates, categorical uuids and float32 prices
+        import pandas as pd
+
+        reader = pd.read_csv(
+            file_path, usecols=RAW_COLUMNS, dtype=RAW_DTYPES, chunksize=chunksize
+        )
+        for chunk in reader:
+            chunk = chunk[RAW_COLUMNS]
+            chunk["date"] = pd.to_datetime(chunk["date"], errors="coerce", utc=True)
+            # rows with unparsable dates or missing values are dropped
+            yield chunk.dropna()
+
+    @staticmethod
+    def stream_clean_data(file_path, chunksize=500_000, sigma=0.5):
+        # Same filters as clean_data, but only one chunk is in memory at a time.
+        # The outlier bounds of every price column depend on the rows kept by the
+        # previous columns, so each column gets its own statistics pass over the file.
+        bounds = {}
+        for col in ["diesel", "e5", "e10"]:
+            count, mean, m2 = 0, 0.0, 0.0
+            for chunk in DataLoader.read_raw_chunks(file_path, chunksize):
+                values = chunk.loc[DataLoader._within_bounds(chunk, bounds), col]
+                values = values.to_numpy(dtype=np.float64)
+                if len(values) == 0:
+                    continue
+                # merge the chunk statistics into the running ones (Chan et al.)
+                chunk_mean = values.mean()
+                chunk_m2 = np.square(values - chunk_mean).sum()
+                total = count + len(values)
+                delta = chunk_mean - mean
+                mean += delta * len(values) / total
+                m2 += chunk_m2 + delta**2 * count * len(values) / total
+                count = total
+            if count == 0:
+                return
+            std = np.sqrt(m2 / count)
+            bounds[col] = (mean - sigma * std, mean + sigma * std)
+
+        for chunk in DataLoader.read_raw_chunks(file_path, chunksize):
+            # remove outliers and rows with prices equal to 0
+            mask = (
+                DataLoader._within_bounds(chunk, bounds)
+                & (chunk["diesel"] != 0)
+                & (chunk["e5"] != 0)
+                & (chunk["e10"] != 0)
+            )
+            if mask.any():
+                yield chunk[mask]
+
+    @staticmethod
+    def _within_bounds(chunk, bounds):
+        mask = np.ones(len(chunk), dtype=bool)
+        for col, (lower, upper) in bounds.items():
+            values = chunk[col].to_numpy(dtype=np.float64)
+            mask &= (values >= lower) & (values <= upper)
+        return mask
+
 
 class Normalizer:
     def __init__(self):
@@ -75,56 +385,51 @@ class FeatureEngineer:
 
     @staticmethod
     def extract_labels(data, *col):
-        # we will predict the e5 price, which is at index 3
+        # price columns to predict, 2: diesel, 3: e5, 4: e10
         labels = data[:, col]
         return labels
 
     @staticmethod
-    def create_time_features(date_column):
+    def create_time_features(date_column, calendar=None):
+        if calendar is None:
+            calendar = HOLIDAY_CALENDAR
+
+        timestamps = np.asarray(date_column)
+        if timestamps.dtype.kind != "M":
+            # strings, datetimes and pandas timestamps are parsed by pandas,
+            # timezone aware timestamps keep their local time
+            import pandas as pd
+
+            date_column = pd.to_datetime(date_column)
+            if isinstance(date_column, pd.Timestamp):
+                date_column = pd.DatetimeIndex([date_column])
+            else:
+                date_column = pd.DatetimeIndex(date_column)
+            timestamps = date_column.tz_localize(None).to_numpy()
+        # a single timestamp is handled as a column with one entry, shape [1, 7]
+        timestamps = np.atleast_1d(timestamps).astype("datetime64[s]")
 
-        date_column = pd.to_datetime(date_column)
+        # local calendar day of every timestamp as days since 1970-01-01
+        days = timestamps.astype("datetime64[D]").astype(np.int64)
+        seconds_of_day = timestamps.astype(np.int64) - days * 86400
 
-        hours_column = date_column.hour
-        minutes_column = date_column.minute
+        hours_column = seconds_of_day // 3600
+        minutes_column = seconds_of_day % 3600 // 60
         time_column = Normalizer.normalize_time(hours_column, minutes_column)
 
         time_sin = np.sin(2 * np.pi * time_column / (24 * 60))
         time_cos = np.cos(2 * np.pi * time_column / (24 * 60))
 
-        day_of_week_column = date_column.dayofweek
+        # 1970-01-01 was a thursday, shift by 3 so that monday is 0
+        day_of_week_column = (days + 3) % 7
 
         day_sin = np.sin(2 * np.pi * day_of_week_column / 7)
         day_cos = np.cos(2 * np.pi * day_of_week_column / 7)
 
         is_weekend = day_of_week_column >= 5
 
-        # german holidays in 2026
-        holidays = [
-            "2026-01-01",
-            "2026-02-11",
-            "2026-02-12",
-            "2026-02-13",
-            "2026-02-14",
-            "2026-02-15",
-            "2026-03-17",
-            "2026-04-06",
-            "2026-05-01",
-            "2026-06-14",
-            "2026-09-29",
-            "2026-10-01",
-            "2026-10-02",
-            "2026-10-03",
-            "2026-10-04",
-            "2026-10-05",
-            "2026-11-02",
-            "2026-12-25",
-        ]
-        holidays = pd.to_datetime(holidays)
-
-        is_holiday = date_column.date() in holidays
-        # is_holiday = date_column.isin(holidays)
-        is_day_before_holiday = date_column.date() in (holidays - pd.Timedelta(days=1))
-        # is_day_before_holiday = date_column.isin(holidays - pd.Timedelta(days=1))
+        is_holiday = calendar.is_holiday(days)
+        is_day_before_holiday = calendar.is_holiday(days + 1)
 
         time_features = np.column_stack(
             (
@@ -141,79 +446,108 @@ class FeatureEngineer:
         return time_features
 
     @staticmethod
-    def create_average_price_feature(data, fuel_type):
-        last_price_column = []
-        stations = pd.read_csv("training_data/misc/stations.csv")
-        print(stations["city"].isna().sum())
+    def create_average_price_feature(data, fuel_type, stations=None):
+        # average price of all stations in the same city during the previous hour
+        import pandas as pd
 
-        data_times = pd.to_datetime(data[:, 0]).floor("h")
-        data_uuids = data[:, 1]
+        if stations is None:
+            stations = pd.read_csv("training_data/misc/stations.csv")
 
         uuid_to_city = stations.set_index("uuid")["city"].to_dict()
-        city_to_uuids = stations.groupby("city")["uuid"].apply(list).to_dict()
-
-        for row in data:
-            station_uuid = row[1]
-            current_time = pd.to_datetime(row[0]).floor("h")
-
-            city = uuid_to_city.get(station_uuid, np.nan)
 
-            if pd.isna(city):
-                last_price_column.append(np.nan)
-                continue
-
-            station_uuids_in_city = city_to_uuids.get(city, [])
-
-            if len(station_uuids_in_city) == 0:
-                last_price_column.append(np.nan)
-                continue
-
-            mask = np.isin(data_uuids, station_uuids_in_city) & (
-                data_times == (current_time - pd.Timedelta(hours=1))
-            )
-
-            city_prices_last_hour = data[mask, fuel_type].astype(float)
-
-            if len(city_prices_last_hour) == 0:
-                last_price_column.append(np.nan)
-            else:
-                last_price_column.append(np.mean(city_prices_last_hour))
-
-        return np.array(last_price_column)
-
-    def create_price_min_24h_features(self):
-        timestamps = pd.to_datetime(self.data[:, 0]).floor(
-            "h"
-        )  # round down to the nearest hour to get one price per hour
-        uuids = self.data[:, 1]
-        prices = self.data[:, 3]  # e5 price is at index 3
+        frame = pd.DataFrame(
+            {
+                "city": pd.Series(data[:, 1]).map(uuid_to_city),
+                "time": pd.to_datetime(data[:, 0]).floor("h"),
+                "price": data[:, fuel_type].astype(float),
+            }
+        )
 
-        price_lookup = {
-            (uuid, time): price for uuid, time, price in zip(uuids, timestamps, prices)
-        }
+        # mean price per city and hour, computed once for the whole day
+        hourly_mean = frame.groupby(["city", "time"])["price"].mean()
 
-        price_min_24h_column = np.zeros(len(self.data))
+        # look up the mean of the hour before every row, missing cities or hours become nan
+        previous_hour = pd.MultiIndex.from_arrays(
+            [frame["city"], frame["time"] - pd.Timedelta(hours=1)]
+        )
+        return hourly_mean.reindex(previous_hour).to_numpy(dtype=float)
 
-        for i in range(len(self.data)):
-            current_uuid = uuids[i]
-            current_time = timestamps[i]
-            past_24h_times = [
-                current_time - pd.Timedelta(hours=h) for h in range(1, 25)
-            ]
-            past_24h_prices = [
-                price_lookup.get((current_uuid, time), prices[i])
-                for time in past_24h_times
-            ]
-            price_min_24h_column[i] = min(past_24h_prices)
+    @staticmethod
+    def create_price_history_features(
+        data, fuel_type, window_hours=24, lag_hours=(1, 24), diff_hours=(3,)
+    ):
+        # per station features from the price history in data, one price per station and hour
+        # columns: [price_min_{window_hours}h], [price_lag_{k}h] for k in lag_hours, [price_diff_{k}h] for k in diff_hours
+        import pandas as pd
+
+        times = pd.to_datetime(data[:, 0]).floor("h")
+        hours = times.as_unit("s").asi8 // 3600
+        codes, _ = pd.factorize(data[:, 1], sort=True)
+        prices = data[:, fuel_type].astype(float)
+
+        # sort by station and hour, stable so the last price of an hour stays last
+        order = np.lexsort((hours, codes))
+        # station and hour packed into one sortable key
+        keys = codes[order].astype(np.int64) * (1 << 40) + hours[order]
+        last_of_hour = np.append(keys[1:] != keys[:-1], True)
+        hourly_keys = keys[last_of_hour]
+        hourly_codes = codes[order][last_of_hour]
+        hourly_hours = hours[order][last_of_hour]
+        hourly_prices = prices[order][last_of_hour]
+
+        # position of every row in the hourly series
+        row_keys = codes.astype(np.int64) * (1 << 40) + hours
+        row_slot = np.searchsorted(hourly_keys, row_keys)
+
+        # minimum over the previous window_hours hours of the same station, rolling min per station
+        hourly = pd.DataFrame(
+            {
+                "station": hourly_codes,
+                "time": (hourly_hours * 3600).astype("datetime64[s]"),
+                "price": hourly_prices,
+            }
+        )
+        # the hourly series is sorted by station and hour, so the results come out in the same order
+        rolling = hourly.groupby("station", sort=False).rolling(
+            f"{window_hours}h", on="time", closed="left"
+        )["price"]
+        window_min = rolling.min().to_numpy()
+        window_count = np.nan_to_num(rolling.count().to_numpy())
+
+        # hours without a price change count as the current price
+        price_min = window_min[row_slot]
+        incomplete = window_count[row_slot] < window_hours
+        price_min[incomplete] = np.fmin(price_min[incomplete], prices[incomplete])
+        columns = [price_min]
+
+        def price_before(k):
+            # last known price of the station at or before k hours ago, the current price if there is none
+            slot = np.searchsorted(hourly_keys, row_keys - k, side="right") - 1
+            found = (slot >= 0) & (hourly_codes[np.maximum(slot, 0)] == codes)
+            return np.where(found, hourly_prices[np.maximum(slot, 0)], prices)
+
+        for k in lag_hours:
+            columns.append(price_before(k))
+        for k in diff_hours:
+            columns.append(prices - price_before(k))
+
+        # shape [data, 1 + len(lag_hours) + len(diff_hours)]
+        return np.column_stack(columns)
 
+    def create_price_min_24h_features(self, window_hours=24):
+        # e5 price is at index 3
         # shape [data, 1]
-        return price_min_24h_column
+        return FeatureEngineer.create_price_history_features(
+            self.data, 3, window_hours, lag_hours=(), diff_hours=()
+        )[:, 0]
 
     def create_brand_one_hot(self, station_uuid_column):
         # we will create a one-hot encoding for the brand of the gas station, which is determined by the station_uuid
         # we will do a lookup for the uuid in a different file that contains the mapping of uuid to brand
         brands = {"Aral": 0, "Jet": 1, "Shell": 2, "Total": 3, "Esso": 4, "Bft": 5}
 
+        import pandas as pd
+
         uuid_df = pd.read_csv("uuid_to_brand.csv")
         mapping_dict = dict(zip(uuid_df["id"], uuid_df["brand"]))
 
@@ -235,108 +569,202 @@ class FeatureEngineer:
         return np.column_stack(columns)
 
     @staticmethod
-    def create_feature_matrix(data, fuel_type):
-        # shape [data, 7 + 1 + 1 + 1 + 6] = [data, 16] , add self.create_brand_one_hot(self.data[:, 1]), self.create_price_lag_features(24), self.create_price_min_24h_features(), , self.create_price_lag_features(1)
+    def create_feature_matrix(data, fuel_type, stations=None):
+        # shape [data, 7 + 1 + 1 + 1 + 6] = [data, 16] , add self.create_brand_one_hot(self.data[:, 1]), FeatureEngineer.create_price_history_features(data, fuel_type)
         return FeatureEngineer.assemble_matrix(
             FeatureEngineer.create_time_features(data[:, 0]),
-            # FeatureEngineer.create_average_price_feature(data, fuel_type),
+            # FeatureEngineer.create_average_price_feature(data, fuel_type, stations),
         )
 
 
-if __name__ == "__main__":
+# station metadata of a pipeline worker process, loaded once by _init_worker
+_worker_stations = None
+
+
+def _init_worker(stations_path):
+    global _worker_stations
+    if stations_path is not None and os.path.exists(stations_path):
+        import pandas as pd
+
+        _worker_stations = pd.read_csv(stations_path)
+
+
+def _file_hash(file_path):
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class _NpyAppender:
+    # writes a .npy file chunk by chunk without knowing the number of rows in advance.
+    # space for the header is reserved at the start and the header is written on close
+
+    HEADER_SIZE = 128
+
+    def __init__(self, path, dtype=np.float32):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        self.row_shape = None
+        self.file = open(path, "wb")
+        self.file.write(b" " * self.HEADER_SIZE)
+
+    def append(self, array):
+        array = np.ascontiguousarray(array, dtype=self.dtype)
+        if self.row_shape is None:
+            self.row_shape = array.shape[1:]
+        elif array.shape[1:] != self.row_shape:
+            raise ValueError(f"chunk rows of shape {array.shape[1:]} do not match {self.row_shape}")
+        array.tofile(self.file)
+        self.rows += len(array)
+
+    def close(self):
+        shape = (self.rows, *self.row_shape) if self.row_shape is not None else (0, 0)
+        header = repr(
+            {"descr": np.lib.format.dtype_to_descr(self.dtype), "fortran_order": False, "shape": shape}
+        ).encode("latin1")
+        # magic, version 1.0, header length, header padded with spaces and ending with a newline
+        length = self.HEADER_SIZE - 10
+        if len(header) + 1 > length:
+            raise ValueError(f"npy header of {self.path} does not fit into {self.HEADER_SIZE} bytes")
+        self.file.seek(0)
+        self.file.write(b"\x93NUMPY\x01\x00" + np.uint16(length).tobytes() + header.ljust(length - 1) + b"\n")
+        self.file.close()
+
+
+def _process_day(file_path, label_columns, shard_dir, chunksize=None):
+    # load -> clean -> labels -> features for one daily csv, written to a shard directory
+    # with X.npy and y.npy per input file. Returns the shard path, the arrays stay on disk
+    labels_key = "-".join(str(col) for col in label_columns)
+    key = f"{_file_hash(file_path)}_v{FEATURE_SET_VERSION}_f{labels_key}"
+    shard_path = os.path.join(shard_dir, key)
+
+    if os.path.exists(shard_path):
+        return shard_path
+
+    print(f"Processing day {os.path.basename(file_path)}...")
+    # write to a temporary directory first so an interrupted run never leaves a broken shard
+    tmp_path = f"{shard_path}.{os.getpid()}.tmp"
+    os.makedirs(tmp_path, exist_ok=True)
+    if chunksize is not None:
+        _process_day_chunked(file_path, label_columns, chunksize, tmp_path)
+    else:
+        _process_day_in_memory(file_path, label_columns, tmp_path)
+    os.replace(tmp_path, shard_path)
+    return shard_path
+
+
+def _load_shard(shard_path):
+    return (
+        np.load(os.path.join(shard_path, "X.npy"), mmap_mode="r"),
+        np.load(os.path.join(shard_path, "y.npy"), mmap_mode="r"),
+    )
+
+
+def _process_day_chunked(file_path, label_columns, chunksize, shard_path):
+    # the current features only depend on the row itself, so every chunk is written
+    # to the shard as soon as it is processed
+    X = _NpyAppender(os.path.join(shard_path, "X.npy"))
+    y = _NpyAppender(os.path.join(shard_path, "y.npy"))
+    for chunk in DataLoader.stream_clean_data(file_path, chunksize):
+        # same column layout as clean_data: [date],[station_uuid],[diesel],[e5],[e10]
+        clean_data = chunk.to_numpy(dtype=object)
+        y.append(FeatureEngineer.extract_labels(clean_data, *label_columns))
+        X.append(FeatureEngineer.create_feature_matrix(clean_data, label_columns[0], _worker_stations))
+    if X.rows == 0:
+        print(f"No valid data for day {os.path.basename(file_path)}, skipping...")
+    X.close()
+    y.close()
+
+
+def _process_day_in_memory(file_path, label_columns, shard_path):
+    data = DataLoader.load_data(file_path)
+    clean_data = DataLoader.clean_data(data)
+    if len(clean_data) == 0:
+        print(f"No valid data for day {os.path.basename(file_path)}, skipping...")
+        X = np.empty((0, 0), dtype=np.float32)
+        y = np.empty((0, len(label_columns)), dtype=np.float32)
+    else:
+        y = FeatureEngineer.extract_labels(clean_data, *label_columns).astype(np.float32)
+        X = FeatureEngineer.create_feature_matrix(
+            clean_data, label_columns[0], _worker_stations
+        ).astype(np.float32)
+    np.save(os.path.join(shard_path, "X.npy"), X)
+    np.save(os.path.join(shard_path, "y.npy"), y.reshape(len(y), -1))
+
+
+class FeaturePipeline:
+    # runs the per day feature creation on a process pool, days that were already
+    # processed with the same input file and feature set version are read from the cache
+
+    def __init__(
+        self,
+        fuel_type,
+        cache_dir="training_data/feature_cache",
+        stations_path="training_data/misc/stations.csv",
+        workers=None,
+        chunksize=None,
+    ):
+        # a single price column or a list of them for a multi-output model
+        if isinstance(fuel_type, (list, tuple)):
+            self.label_columns = tuple(fuel_type)
+        else:
+            self.label_columns = (fuel_type,)
+        self.cache_dir = cache_dir
+        self.stations_path = stations_path
+        self.workers = workers
+        # rows per chunk for the streaming ingestion, None loads each day at once
+        self.chunksize = chunksize
+
+    def run(self, raw_data_dir, destination, label_names, feature_names=None):
+        # writes the features and labels of all days into the feature store at destination.
+        # workers write day shards to disk, they are copied into the store one after another
+        # so memory does not grow with the number of days
+        days = sorted(os.listdir(raw_data_dir))
+        paths = [os.path.join(raw_data_dir, day) for day in days]
+
+        with contextlib.ExitStack() as stack:
+            if self.cache_dir is not None:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                shard_dir = self.cache_dir
+            else:
+                shard_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="feature-shards-"))
+            executor = stack.enter_context(
+                ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=_init_worker,
+                    initargs=(self.stations_path,),
+                )
+            )
+            shard_paths = list(
+                executor.map(
+                    _process_day,
+                    paths,
+                    [self.label_columns] * len(paths),
+                    [shard_dir] * len(paths),
+                    [self.chunksize] * len(paths),
+                )
+            )
+            DataLoader.save_feature_store_shards(
+                [_load_shard(path) for path in shard_paths], destination, label_names, feature_names
+            )
 
-    # create training features and labels
-    X = []
-    y = []
 
-    # lables for 2: diesel, 3: e5, 4: e10
-    fuel_type = 4
+if __name__ == "__main__":
 
-    raw_data_dir = "training_data/raw_data/training"
+    # lables for 2: diesel, 3: e5, 4: e10, all of them are stored so any model can pick its labels
+    fuel_names = ["diesel", "e5", "e10"]
 
-    # the raw training data is stored  in "training_data/raw_data", they are ordered by days
-    for day in os.listdir(raw_data_dir):
-        print(f"Processing day {day}...")
-        data = DataLoader.load_data(os.path.join(raw_data_dir, day))
-        clean_data = DataLoader.clean_data(data)
-        if len(clean_data) == 0:
-            print(f"No valid data for day {day}, skipping...")
-            continue
-        labels = FeatureEngineer.extract_labels(clean_data, fuel_type)
-        features = FeatureEngineer.create_feature_matrix(clean_data, fuel_type)
-        X.append(features)
-        y.append(labels)
-
-    # shuffle data set
-    indices = np.random.permutation(len(X))
-    # X and y are lists at this point; use numpy indexing after converting to array
-    # X = np.array(X, dtype=object)[indices]
-    # y = np.array(y, dtype=object)[indices]
-
-    X = np.vstack(X).astype(np.float32)
-    y = np.vstack(y).astype(np.float32)
-
-    DataLoader.save_data(X, "training_data/features_and_lables/train_data/X.csv")
-    DataLoader.save_data(y, "training_data/features_and_lables/train_data/y.csv")
-
-    # create val features and labels
-    X = []
-    y = []
-
-    raw_data_dir = "training_data/raw_data/validation"
-
-    # the raw training data is stored  in "training_data/raw_data", they are ordered by days
-    for day in os.listdir(raw_data_dir):
-        print(f"Processing day {day}...")
-        data = DataLoader.load_data(os.path.join(raw_data_dir, day))
-        clean_data = DataLoader.clean_data(data)
-        if len(clean_data) == 0:
-            print(f"No valid data for day {day}, skipping...")
-            continue
-        labels = FeatureEngineer.extract_labels(clean_data, fuel_type)
-        features = FeatureEngineer.create_feature_matrix(clean_data, fuel_type)
-        X.append(features)
-        y.append(labels)
-
-    # shuffle data set
-    indices = np.random.permutation(len(X))
-    # X and y are lists at this point; use numpy indexing after converting to array
-    # X = np.array(X, dtype=object)[indices]
-    y = np.array(y, dtype=object)[indices]
-
-    X = np.vstack(X).astype(np.float32)
-    y = np.vstack(y).astype(np.float32)
-
-    DataLoader.save_data(X, "training_data/features_and_lables/val_data/X_val.csv")
-    DataLoader.save_data(y, "training_data/features_and_lables/val_data/y_val.csv")
-
-    # create eval features and labels
-    X = []
-    y = []
-
-    raw_data_dir = "training_data/raw_data/evaluation"
-
-    # the raw training data is stored  in "training_data/raw_data", they are ordered by days
-    for day in os.listdir(raw_data_dir):
-        print(f"Processing day {day}...")
-        data = DataLoader.load_data(os.path.join(raw_data_dir, day))
-        clean_data = DataLoader.clean_data(data)
-        if len(clean_data) == 0:
-            print(f"No valid data for day {day}, skipping...")
-            continue
-        labels = FeatureEngineer.extract_labels(clean_data, fuel_type)
-        features = FeatureEngineer.create_feature_matrix(clean_data, fuel_type)
-        X.append(features)
-        y.append(labels)
-
-    # shuffle data set
-    indices = np.random.permutation(len(X))
-    # X and y are lists at this point; use numpy indexing after converting to array
-    # X = np.array(X, dtype=object)[indices]
-    # y = np.array(y, dtype=object)[indices]
-
-    X = np.vstack(X).astype(np.float32)
-    y = np.vstack(y).astype(np.float32)
-
-    DataLoader.save_data(X, "training_data/features_and_lables/eval_data/X_eval.csv")
-    DataLoader.save_data(y, "training_data/features_and_lables/eval_data/y_eval.csv")
+    pipeline = FeaturePipeline(
+        [FUEL_COLUMNS[name] for name in fuel_names], chunksize=500_000
+    )
+
+    # the raw data is stored in "training_data/raw_data", ordered by days
+    for raw_data_dir, destination in [
+        ("training_data/raw_data/training", "training_data/features_and_lables/train_data"),
+        ("training_data/raw_data/validation", "training_data/features_and_lables/val_data"),
+        ("training_data/raw_data/evaluation", "training_data/features_and_lables/eval_data"),
+    ]:
+        pipeline.run(raw_data_dir, destination, label_names=fuel_names, feature_names=FEATURE_NAMES)
@@ -2,31 +2,38 @@ from datetime import datetime, timedelta
 
 import numpy as np
 import pandas as pd
-from mlp import MLP
-from data_processing import DataLoader, FeatureEngineer
+from mlp import MLP, artifact_path
+from data_processing import DataLoader, FeatureEngineer, FUEL_COLUMNS
+from metrics import evaluate
+from batches import ShardedBatches
 import matplotlib.pyplot as plt
 
 
-# initialize MLP
-mlp = MLP(7, 16, 2, 1)
-mlp.load_weights("model/weights/e10")
+# the model artifact written by train.py for all fuel types
+model_path = artifact_path(list(FUEL_COLUMNS))
 
-# load eval data
-X = DataLoader.load_data("training_data/features_and_lables/eval_data/X_eval.csv")
-y = DataLoader.load_data("training_data/features_and_lables/eval_data/y_eval.csv")
+# rebuild the MLP from the artifact, the header knows the architecture and the predicted fuel types
+mlp, header = MLP.load(model_path)
+fuel_types = header["outputs"]
+print(f"model of epoch {header['training']['epoch']}, validation loss {header['training']['val_loss']:.6f}")
 
+# load eval data, streamed from disk in chunks
+X, y = DataLoader.load_feature_store(
+    "training_data/features_and_lables/eval_data", labels=fuel_types, stack_labels=False
+)
 
-def evaluate(mlp, X_test, y_test):
-    y_pred = mlp.forward(X_test)
 
-    mae = np.mean(np.abs(y_pred - y_test))
-
-    print(f"MAE: {mae:.4f} Euro")
-
-
-evaluate(mlp, X, y)
-y_pred = mlp.forward(X)
-print(y.max(), y.min())
+metrics = evaluate(mlp, ShardedBatches(X, y, shuffle=False))
+# one value per fuel type
+mae = np.atleast_1d(metrics["mae"])
+rmse = np.atleast_1d(metrics["rmse"])
+q90 = np.atleast_1d(metrics["q90"])
+for i, fuel_type in enumerate(fuel_types):
+    print(f"{fuel_type}:")
+    print(f"  MAE: {mae[i]:.4f} Euro")
+    print(f"  RMSE: {rmse[i]:.4f} Euro")
+    print(f"  90% of the errors are below {q90[i]:.3f} Euro")
+print(max(column.max() for column in y), min(column.min() for column in y))
 
 # plt.figure(figsize=(10, 6))
 # plt.scatter(y, y_pred, alpha=0.5)
@@ -44,7 +51,9 @@ future_timestamps = [last_timestamp + timedelta(hours=i) for i in range(1, 25)]
 future_features = FeatureEngineer.create_time_features(future_timestamps)
 future_predictions = mlp.forward(future_features)
 plt.figure(figsize=(12, 6))
-plt.plot(future_timestamps, future_predictions.flatten(), marker="o")
+for i, fuel_type in enumerate(fuel_types):
+    plt.plot(future_timestamps, future_predictions[:, i], marker="o", label=fuel_type)
+plt.legend()
 plt.xlabel("Time")
 plt.ylabel("Predicted Price (Euro)")
 plt.title("Predicted Fuel Prices for the Next 24 Hours")
@@ -0,0 +1,79 @@
+import numpy as np
+
+
+class StreamingMetrics:
+    # Accumulates MSE, MAE, RMSE and quantiles of the absolute error chunk by chunk.
+    # Quantiles come from a fixed histogram of absolute errors, so memory does not grow
+    # with the number of rows. The resolution is bin_width (0.1 cent by default).
+
+    def __init__(self, n_outputs=1, bin_width=0.001, max_error=1.0):
+        self.bin_width = bin_width
+        self.n_bins = int(np.ceil(max_error / bin_width))
+        self.count = 0
+        self.squared_error = np.zeros(n_outputs)
+        self.absolute_error = np.zeros(n_outputs)
+        # the last bin collects every error above max_error
+        self.histogram = np.zeros((n_outputs, self.n_bins + 1), dtype=np.int64)
+
+    def update(self, y_true, y_pred):
+        error = np.asarray(y_pred, dtype=np.float64) - np.asarray(y_true, dtype=np.float64)
+        error = error.reshape(len(error), -1)
+        absolute = np.abs(error)
+
+        self.count += len(error)
+        self.squared_error += np.sum(np.square(error), axis=0)
+        self.absolute_error += np.sum(absolute, axis=0)
+
+        bins = np.minimum((absolute / self.bin_width).astype(np.int64), self.n_bins)
+        for output in range(error.shape[1]):
+            self.histogram[output] += np.bincount(bins[:, output], minlength=self.n_bins + 1)
+
+    def quantile(self, q):
+        # upper edge of the histogram bin that contains the q quantile, per output
+        cumulative = np.cumsum(self.histogram, axis=1)
+        index = np.argmax(cumulative >= q * self.count, axis=1)
+        return (index + 1) * self.bin_width
+
+    def result(self, quantiles=(0.5, 0.9, 0.99)):
+        mse = self.squared_error / self.count
+        metrics = {
+            "mse": mse,
+            "rmse": np.sqrt(mse),
+            "mae": self.absolute_error / self.count,
+        }
+        for q in quantiles:
+            metrics[f"q{round(q * 100)}"] = self.quantile(q)
+        # single output models get plain floats
+        if len(mse) == 1:
+            metrics = {name: float(value[0]) for name, value in metrics.items()}
+        metrics["count"] = self.count
+        return metrics
+
+
+def evaluate(model, X, y=None, chunk_size=65536, stride=1, quantiles=(0.5, 0.9, 0.99)):
+    # one forward pass over fixed size chunks, stride > 1 evaluates every stride-th row only.
+    # X and y arrays, or a batch source like ShardedBatches as X that reads the chunks in the background.
+    # y can also be a list of label columns, they are read chunk by chunk
+    if y is None:
+        metrics = StreamingMetrics(n_outputs=X.n_outputs)
+        for X_chunk, y_chunk in X.chunks(chunk_size, stride):
+            metrics.update(y_chunk, model.predict(X_chunk))
+        return metrics.result(quantiles)
+
+    if stride > 1:
+        X = X[::stride]
+        y = [column[::stride] for column in y] if isinstance(y, (list, tuple)) else y[::stride]
+    if isinstance(y, (list, tuple)):
+        n_outputs = len(y)
+    else:
+        y = y.reshape(len(y), -1)
+        n_outputs = y.shape[1]
+
+    metrics = StreamingMetrics(n_outputs=n_outputs)
+    for i in range(0, len(X), chunk_size):
+        if isinstance(y, (list, tuple)):
+            y_chunk = np.column_stack([column[i : i + chunk_size] for column in y])
+        else:
+            y_chunk = y[i : i + chunk_size]
+        metrics.update(y_chunk, model.predict(X[i : i + chunk_size]))
+    return metrics.result(quantiles)
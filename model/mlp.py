@@ -1,5 +1,24 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import zipfile
+from pathlib import Path
 import numpy as np
 
+# version of the single file model format written by MLP.save
+ARTIFACT_VERSION = 1
+
+# name of the artifact of a model with one output per fuel type, served by the API if it exists
+MULTI_OUTPUT_MODEL = "multi"
+
+
+def artifact_path(fuel_types, weights_dir="model/weights"):
+    # artifact train.py writes for a model of the fuel types, a single fuel type keeps its own name
+    name = MULTI_OUTPUT_MODEL if len(fuel_types) > 1 else fuel_types[0]
+    return os.path.join(weights_dir, f"{name}.npz")
+
 
 def mse(y_true, y_pred):
     return np.mean(np.square(y_pred - y_true))
@@ -10,6 +29,26 @@ def mse_derivative(y_true, y_pred):
     return (2 / n) * (y_pred - y_true)
 
 
+def _mapped_member(buffer, info):
+    # view of an uncompressed .npy member of a zip file that is memory mapped as buffer.
+    # the local file header is 30 bytes plus the file name and extra field
+    start = info.header_offset
+    name_length = int(buffer[start + 26 : start + 28].view("<u2")[0])
+    extra_length = int(buffer[start + 28 : start + 30].view("<u2")[0])
+    start += 30 + name_length + extra_length
+
+    stream = io.BytesIO(buffer[start : start + min(info.file_size, 65536)].tobytes())
+    version = np.lib.format.read_magic(stream)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+    start += stream.tell()
+    count = int(np.prod(shape, dtype=np.int64))
+    array = buffer[start : start + count * dtype.itemsize].view(dtype)
+    return array.reshape(shape, order="F" if fortran_order else "C")
+
+
 class NeuronLayer:
     def __init__(self, input_size, output_size):
         # use He initialization for weights
@@ -43,18 +82,36 @@ class NeuronLayer:
         # delta.shape = [n_batch, n_neurons]
         delta = output_gradient * relu_gradient
 
+        # gradient buffers are allocated once and overwritten by every batch
+        dtype = np.result_type(self.input_data, delta)
+        if self.delta_weights is None or self.delta_weights.dtype != dtype:
+            self.delta_weights = np.empty(self.weights.shape, dtype=dtype)
+            self.delta_biases = np.empty(self.biases.shape, dtype=dtype)
+
         # [n_inputs, n_batch] @ [n_batch, n_neurons] = [n_inputs, n_neurons]
-        self.delta_weights = np.dot(self.input_data.T, delta)
+        np.dot(self.input_data.T, delta, out=self.delta_weights)
         # [n_batch, n_neurons] -> [1, n_neurons]
-        self.delta_biases = np.sum(delta, axis=0, keepdims=True)
+        np.sum(delta, axis=0, keepdims=True, out=self.delta_biases)
 
         # return gradient for next layer
         # [n_batch, n_inputs]
         return np.dot(delta, self.weights.T)
 
     def update(self, learning_rate):
-        self.weights = self.weights - learning_rate * self.delta_weights
-        self.biases = self.biases - learning_rate * self.delta_biases
+        self.weights -= learning_rate * self.delta_weights
+        self.biases -= learning_rate * self.delta_biases
+
+    def parameters(self):
+        return [self.weights, self.biases]
+
+    def gradients(self):
+        return [self.delta_weights, self.delta_biases]
+
+    def astype(self, dtype):
+        self.weights = self.weights.astype(dtype)
+        self.biases = self.biases.astype(dtype)
+        self.delta_weights = None
+        self.delta_biases = None
 
 
 class MLP:
@@ -84,6 +141,90 @@ class MLP:
         for layer in self.layers:
             layer.update(learning_rate)
 
+    def parameters(self):
+        return [p for layer in self.layers for p in layer.parameters()]
+
+    def gradients(self):
+        return [g for layer in self.layers for g in layer.gradients()]
+
+    def astype(self, dtype):
+        for layer in self.layers:
+            layer.astype(dtype)
+        return self
+
+    def architecture(self):
+        # [n_inputs, n_neurons] of every layer, enough to rebuild the MLP
+        return {"activation": "relu", "layers": [list(layer.weights.shape) for layer in self.layers]}
+
+    @classmethod
+    def from_architecture(cls, architecture):
+        layers = architecture["layers"]
+        mlp = cls(layers[0][0], layers[0][1], len(layers) - 1, layers[-1][1])
+        if mlp.architecture()["layers"] != [list(shape) for shape in layers]:
+            raise ValueError(f"unsupported architecture {layers}")
+        return mlp
+
+    def save(self, file_path, **metadata):
+        # One .npz file with every layer and a JSON header (header.json) with the architecture
+        # and the given metadata. It is written to a temporary file and renamed, so a worker
+        # that reloads the model never reads a half written file.
+        header = {"artifact_version": ARTIFACT_VERSION, "architecture": self.architecture(), **metadata}
+        directory = os.path.dirname(os.path.abspath(file_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".model-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                # stored uncompressed, so the arrays can be memory mapped
+                with zipfile.ZipFile(f, "w", zipfile.ZIP_STORED) as archive:
+                    archive.writestr("header.json", json.dumps(header, indent=2))
+                    for i, layer in enumerate(self.layers):
+                        for name, array in (("weights", layer.weights), ("biases", layer.biases)):
+                            with archive.open(f"layer_{i}_{name}.npy", "w") as member:
+                                np.lib.format.write_array(member, np.ascontiguousarray(array))
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, file_path, mmap_mode=None):
+        # returns (mlp, header) of a file written by save, the MLP is built from the header alone.
+        # mmap_mode="r" maps the weights instead of reading them
+        with open(file_path, "rb") as f:
+            archive = zipfile.ZipFile(f)
+            header = json.loads(archive.read("header.json"))
+            if header.get("artifact_version") != ARTIFACT_VERSION:
+                raise ValueError(f"unsupported model artifact version {header.get('artifact_version')}")
+            buffer = np.memmap(f, dtype=np.uint8, mode=mmap_mode) if mmap_mode is not None else None
+            arrays = {}
+            for info in archive.infolist():
+                if not info.filename.endswith(".npy"):
+                    continue
+                if buffer is not None and info.compress_type == zipfile.ZIP_STORED:
+                    arrays[info.filename[:-4]] = _mapped_member(buffer, info)
+                else:
+                    with archive.open(info) as member:
+                        arrays[info.filename[:-4]] = np.lib.format.read_array(member)
+
+        mlp = cls.from_architecture(header["architecture"])
+        for i, layer in enumerate(mlp.layers):
+            layer.weights = arrays[f"layer_{i}_weights"]
+            layer.biases = arrays[f"layer_{i}_biases"]
+        return mlp, header
+
+    @classmethod
+    def load_weights_folder(cls, file_path):
+        # model saved by save_weights, the architecture is read from the shapes of the layer files
+        n_layers = len(list(Path(file_path).glob("layer_*_weights.npy")))
+        weights = [np.load(f"{file_path}/layer_{i}_weights.npy") for i in range(n_layers)]
+        if not weights:
+            raise FileNotFoundError(f"no weights in {file_path}")
+        mlp = cls.from_architecture({"layers": [list(w.shape) for w in weights]})
+        mlp.load_weights(file_path)
+        return mlp
+
     def save_weights(self, file_path):
         # save weights and biases to file
         for i, layer in enumerate(self.layers):
@@ -98,3 +239,52 @@ class MLP:
 
     def predict(self, X):
         return self.forward(X)
+
+
+class InferenceEngine:
+    # Stateless forward pass built from a trained MLP, safe to share between threads.
+    # Parameters are float32 copies, so retraining or reloading the MLP does not affect it.
+    # Batches up to max_batch_size rows reuse preallocated buffers of the calling thread.
+
+    def __init__(self, mlp, max_batch_size=256, dtype=np.float32):
+        self.dtype = dtype
+        self.max_batch_size = max_batch_size
+        # weights.shape = [n_inputs, n_neurons]
+        # always copied, a float32 MLP would otherwise share its arrays with the engine
+        self.weights = [np.array(layer.weights, dtype=dtype, order="C", copy=True) for layer in mlp.layers]
+        # biases.shape = [n_neurons]
+        self.biases = [np.array(layer.biases, dtype=dtype, copy=True).reshape(-1) for layer in mlp.layers]
+        self._local = threading.local()
+
+    def _buffers(self, n):
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = [
+                np.empty((self.max_batch_size, w.shape[1]), dtype=self.dtype)
+                for w in self.weights
+            ]
+            self._local.buffers = buffers
+        return [buffer[:n] for buffer in buffers]
+
+    def predict(self, X, out=None):
+        X = np.asarray(X, dtype=self.dtype)
+        n = X.shape[0]
+        if n <= self.max_batch_size:
+            buffers = self._buffers(n)
+        else:
+            buffers = [np.empty((n, w.shape[1]), dtype=self.dtype) for w in self.weights]
+        if out is not None:
+            buffers[-1] = out
+
+        output = X
+        for weights, biases, buffer in zip(self.weights, self.biases, buffers):
+            np.dot(output, weights, out=buffer)
+            # bias and ReLU are applied in place on the same buffer
+            buffer += biases
+            np.maximum(buffer, 0, out=buffer)
+            output = buffer
+
+        # the thread local buffer is reused by the next call, hand out a copy
+        if out is None and n <= self.max_batch_size:
+            return output.copy()
+        return output
@@ -0,0 +1,144 @@
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from data_processing import DataLoader
+from mlp import MLP
+from trainer import SGD, Momentum, Adam, Trainer
+from metrics import evaluate
+
+OPTIMIZERS = {"sgd": SGD, "momentum": Momentum, "adam": Adam}
+
+# datasets of a worker process, memory mapped so all workers share the same pages.
+# y is a list of label columns, stacking them would give every worker its own copy
+_X = None
+_y = None
+_X_val = None
+_y_val = None
+# trial -> best validation loss after every epoch, shared by all workers
+_history = None
+
+
+def _init_worker(train_dir, val_dir, labels, history):
+    global _X, _y, _X_val, _y_val, _history
+    _X, _y = DataLoader.load_feature_store(train_dir, labels=labels, stack_labels=False)
+    _X_val, _y_val = DataLoader.load_feature_store(val_dir, labels=labels, stack_labels=False)
+    _history = history
+
+
+def _should_prune(trial, epoch, best_loss, grace_epochs, min_trials):
+    # median stopping rule: stop if the best loss so far is worse than the median
+    # of what the other trials had reached after the same number of epochs
+    if epoch < grace_epochs:
+        return False
+    others = [
+        losses[epoch]
+        for other, losses in _history.items()
+        if other != trial and len(losses) > epoch
+    ]
+    if len(others) < min_trials:
+        return False
+    return best_loss > np.median(others)
+
+
+def run_trial(trial, config, num_epochs, patience, grace_epochs, min_trials, seed):
+    start = time.perf_counter()
+    mlp = MLP(_X.shape[1], config["hidden_size"], config["hidden_layers"], len(_y))
+    optimizer = OPTIMIZERS[config["optimizer"]](config["learning_rate"])
+    trainer = Trainer(mlp, optimizer, batch_size=config["batch_size"], seed=seed)
+
+    best_loss = float("inf")
+    losses = []
+    val_counter = 0
+    status = "completed"
+    for epoch in range(num_epochs):
+        trainer.train_epoch(_X, _y)
+        val_loss = float(np.mean(evaluate(mlp, _X_val, _y_val)["mse"]))
+        if val_loss < best_loss:
+            best_loss = val_loss
+            val_counter = 0
+        else:
+            val_counter += 1
+
+        losses.append(best_loss)
+        _history[trial] = losses
+
+        if val_counter > patience:
+            status = "early_stopped"
+            break
+        # a trial that ran all epochs is completed, not pruned
+        if epoch < num_epochs - 1 and _should_prune(trial, epoch, best_loss, grace_epochs, min_trials):
+            status = "pruned"
+            break
+
+    print(f"trial {trial} {status} after {epoch + 1} epochs, best validation loss {best_loss:.6f}")
+    return {
+        "trial": trial,
+        **config,
+        "best_val_loss": best_loss,
+        "epochs": epoch + 1,
+        "wall_time": time.perf_counter() - start,
+        "status": status,
+    }
+
+
+def grid(**options):
+    # every combination of the given option lists
+    names = list(options)
+    return [dict(zip(names, values)) for values in itertools.product(*options.values())]
+
+
+def run_sweep(
+    configs,
+    train_dir,
+    val_dir,
+    labels,
+    results_path,
+    workers=None,
+    num_epochs=200,
+    patience=15,
+    grace_epochs=10,
+    min_trials=3,
+    seed=0,
+):
+    with multiprocessing.Manager() as manager:
+        history = manager.dict()
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(train_dir, val_dir, labels, history),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    run_trial, trial, config, num_epochs, patience, grace_epochs, min_trials, seed + trial
+                )
+                for trial, config in enumerate(configs)
+            ]
+            results = [future.result() for future in futures]
+
+    results = pd.DataFrame(results).sort_values("best_val_loss")
+    os.makedirs(os.path.dirname(results_path) or ".", exist_ok=True)
+    results.to_csv(results_path, index=False)
+    return results
+
+
+if __name__ == "__main__":
+    configs = grid(
+        hidden_size=[8, 16, 32],
+        hidden_layers=[1, 2, 3],
+        learning_rate=[0.0003, 0.001, 0.003],
+        batch_size=[256, 1024],
+        optimizer=["adam"],
+    )
+    print(f"running {len(configs)} trials...")
+    results = run_sweep(
+        configs,
+        "training_data/features_and_lables/train_data",
+        "training_data/features_and_lables/val_data",
+        labels=["diesel", "e5", "e10"],
+        results_path="training_data/sweep_results.csv",
+    )
+    print(results.head(10).to_string(index=False))
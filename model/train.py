@@ -1,30 +1,19 @@
+import os
+import time
 import numpy as np
-from data_processing import DataLoader
-from mlp import MLP, mse
+from data_processing import DataLoader, FEATURE_NAMES, FEATURE_SET_VERSION, FUEL_COLUMNS
+from mlp import MLP, artifact_path
+from trainer import Adam, Trainer
+from metrics import evaluate
+from batches import ShardedBatches
 
-# initialize MLP with 7 input features, 4 hidden layers with 16 neurons each, and 1 output layer
-print("initializing mlp...")
-mlp = MLP(7, 16, 2, 1)
-
-# Load training data
-print("Loading X...")
-X = DataLoader.load_data("training_data/features_and_lables/train_data/X.csv")
-print("Loading y...")
-y = DataLoader.load_data("training_data/features_and_lables/train_data/y.csv")
-
-print(X.shape, y.shape)
-
-print("Loading X_val...")
-X_val = DataLoader.load_data("training_data/features_and_lables/val_data/X_val.csv")
-print("Loading y_val...")
-y_val = DataLoader.load_data("training_data/features_and_lables/val_data/y_val.csv")
+# fuel types trained together, one output each. A single fuel type trains the old one-output model
+fuel_types = list(FUEL_COLUMNS)
+model_path = artifact_path(fuel_types)
 
-print(X_val.shape, y_val.shape)
-
-X = np.asarray(X)
-y = np.asarray(y)
-X_val = np.asarray(X_val)
-y_val = np.asarray(y_val)
+# initialize MLP with 7 input features, 2 hidden layers with 16 neurons each, and one output per fuel type
+print("initializing mlp...")
+mlp = MLP(7, 16, 2, len(fuel_types))
 
 # training parameters
 learning_rate = 0.001
@@ -33,38 +22,69 @@ num_epochs = 1000
 val_counter = 0
 patience = 15
 best_val_los = float("inf")
+# validate on every val_stride-th row only, with a full validation every full_val_every epochs
+val_stride = 1
+full_val_every = 10
+
+# Load training data, the feature store is memory mapped and streamed from disk in shuffled shards,
+# so the datasets do not have to fit into memory
+print("Loading training data...")
+X, y = DataLoader.load_feature_store(
+    "training_data/features_and_lables/train_data", labels=fuel_types, stack_labels=False
+)
+train_data = ShardedBatches(X, y, batch_size=batch_size)
 
+print(X.shape, len(y))
+
+print("Loading validation data...")
+X_val, y_val = DataLoader.load_feature_store(
+    "training_data/features_and_lables/val_data", labels=fuel_types, stack_labels=False
+)
+val_data = ShardedBatches(X_val, y_val, shuffle=False)
+
+print(X_val.shape, len(y_val))
+
+# the trainer updates the weights in place with adam, the batches come shuffled from train_data
+trainer = Trainer(mlp, Adam(learning_rate), batch_size=batch_size)
+
+os.makedirs(os.path.dirname(model_path), exist_ok=True)
 print("starting training...")
 for epoch in range(num_epochs):
     print(f"Training in epoch {epoch}")
-    # shuffle data set
-    # indices = np.random.permutation(len(X))
-    # X = X[indices]
-    # y = y[indices]
-
-    for i in range(0, len(X), batch_size):
-        X_batch = X[i : i + batch_size]
-        y_batch = y[i : i + batch_size]
-
-        y_pred = mlp.forward(X_batch)
-        mlp.backward(y_batch, y_pred)
-        mlp.update(learning_rate)
+    train_loss = trainer.train_epoch(train_data)
 
-    print("current epoch training loss:", mse(y_batch, y_pred))
-    # mae loss
-    print("current epoch training MAE:", np.mean(np.abs(y_batch - y_pred)))
-    print("current epoch validation loss:", mse(y_val, mlp.forward(X_val)))
-    print("current epoch validation MAE:", np.mean(np.abs(y_val - mlp.forward(X_val))))
+    print("current epoch training loss:", train_loss)
 
-    # validate
-    val_pred = mlp.forward(X_val)
-    val_loss = mse(y_val, val_pred)
+    # validate, all metrics come from one pass over the validation set
+    stride = 1 if epoch % full_val_every == 0 else val_stride
+    val_metrics = evaluate(mlp, val_data, stride=stride)
+    # early stopping uses the mean loss over all fuel types
+    val_loss = float(np.mean(val_metrics["mse"]))
+    print("current epoch validation loss:", val_loss)
+    print("current epoch validation MAE:", val_metrics["mae"])
 
     if val_loss <= best_val_los:
         best_val_los = val_loss
         val_counter = 0
-        # save current best model
-        mlp.save_weights("model/weights/e10")
+        # save current best model, one file that is replaced atomically
+        mlp.save(
+            model_path,
+            outputs=fuel_types,
+            feature_set_version=FEATURE_SET_VERSION,
+            feature_names=FEATURE_NAMES,
+            # the calendar features and prices are used unscaled
+            normalization=None,
+            training={
+                "epoch": epoch,
+                "train_loss": train_loss,
+                "val_loss": val_loss,
+                "val_mae": np.atleast_1d(val_metrics["mae"]).tolist(),
+                "learning_rate": learning_rate,
+                "batch_size": batch_size,
+                "train_rows": len(train_data),
+                "saved_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            },
+        )
     else:
         val_counter += 1
 
@@ -0,0 +1,125 @@
+import numpy as np
+
+
+class SGD:
+    def __init__(self, learning_rate=0.001):
+        self.learning_rate = learning_rate
+        # one scratch buffer per parameter, so steps do not allocate
+        self.scratch = None
+
+    def _init_state(self, params):
+        self.scratch = [np.empty_like(p) for p in params]
+
+    def step(self, params, grads):
+        if self.scratch is None:
+            self._init_state(params)
+        for p, g, s in zip(params, grads, self.scratch):
+            np.multiply(g, self.learning_rate, out=s)
+            p -= s
+
+
+class Momentum(SGD):
+    def __init__(self, learning_rate=0.001, momentum=0.9):
+        super().__init__(learning_rate)
+        self.momentum = momentum
+        self.velocity = None
+
+    def _init_state(self, params):
+        super()._init_state(params)
+        self.velocity = [np.zeros_like(p) for p in params]
+
+    def step(self, params, grads):
+        if self.scratch is None:
+            self._init_state(params)
+        for p, g, s, v in zip(params, grads, self.scratch, self.velocity):
+            # v = momentum * v - learning_rate * g
+            v *= self.momentum
+            np.multiply(g, self.learning_rate, out=s)
+            v -= s
+            p += v
+
+
+class Adam(SGD):
+    def __init__(self, learning_rate=0.001, beta1=0.9, beta2=0.999, epsilon=1e-8):
+        super().__init__(learning_rate)
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+        self.t = 0
+        self.m = None
+        self.v = None
+
+    def _init_state(self, params):
+        super()._init_state(params)
+        self.m = [np.zeros_like(p) for p in params]
+        self.v = [np.zeros_like(p) for p in params]
+
+    def step(self, params, grads):
+        if self.scratch is None:
+            self._init_state(params)
+        self.t += 1
+        # bias correction folded into the step size
+        step_size = (
+            self.learning_rate
+            * np.sqrt(1 - self.beta2**self.t)
+            / (1 - self.beta1**self.t)
+        )
+        for p, g, s, m, v in zip(params, grads, self.scratch, self.m, self.v):
+            # m = beta1 * m + (1 - beta1) * g
+            m *= self.beta1
+            np.multiply(g, 1 - self.beta1, out=s)
+            m += s
+            # v = beta2 * v + (1 - beta2) * g^2
+            v *= self.beta2
+            np.multiply(g, g, out=s)
+            s *= 1 - self.beta2
+            v += s
+            # p -= step_size * m / (sqrt(v) + epsilon)
+            np.sqrt(v, out=s)
+            s += self.epsilon
+            np.divide(m, s, out=s)
+            s *= step_size
+            p -= s
+
+
+class Trainer:
+    # trains an MLP with shuffled mini-batches and an in place optimizer, float32 end to end
+
+    def __init__(self, mlp, optimizer, batch_size=1024, dtype=np.float32, seed=None):
+        self.mlp = mlp.astype(dtype)
+        self.optimizer = optimizer
+        self.batch_size = batch_size
+        self.dtype = dtype
+        self.rng = np.random.default_rng(seed)
+
+    def batches(self, X, y=None):
+        # a batch source like ShardedBatches shuffles and prefetches its batches itself
+        if y is None:
+            return X.epoch()
+        return self._array_batches(X, y)
+
+    def _array_batches(self, X, y):
+        # a new permutation of row indices every epoch, the dataset itself is never copied or reordered.
+        # y can also be a list of label columns, they are gathered per batch
+        permutation = self.rng.permutation(len(X))
+        for i in range(0, len(X), self.batch_size):
+            # sorted indices keep reads from memory mapped data mostly sequential
+            index = np.sort(permutation[i : i + self.batch_size])
+            if isinstance(y, (list, tuple)):
+                y_batch = np.column_stack([np.asarray(column[index], dtype=self.dtype) for column in y])
+            else:
+                y_batch = np.asarray(y[index], dtype=self.dtype)
+            yield np.asarray(X[index], dtype=self.dtype), y_batch
+
+    def train_epoch(self, X, y=None):
+        # X and y arrays, or a batch source like ShardedBatches as X.
+        # returns the mean training loss (mse) over all batches of the epoch
+        total_loss = 0.0
+        values = 0
+        for X_batch, y_batch in self.batches(X, y):
+            y_pred = self.mlp.forward(X_batch)
+            self.mlp.backward(y_batch, y_pred)
+            self.optimizer.step(self.mlp.parameters(), self.mlp.gradients())
+            total_loss += float(np.sum(np.square(y_pred - y_batch)))
+            values += y_batch.size
+        return total_loss / values